@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+
+"""
+Regression benchmark for the time it takes to import `pydirdiff`.
+
+Run it from the root of the repository like this:
+
+    $ python3 benchmarks/startup.py
+    $ python3 benchmarks/startup.py --save
+
+The median import time over many fresh interpreters is compared to the
+value stored in `benchmarks/baseline.json`. The script exits with an error
+if it got slower by more than the tolerance, or if importing the package
+loaded any module that is only needed for optional features.
+"""
+
+# Built-in modules #
+import os, sys, json, time, argparse, subprocess
+
+# Constants #
+bench_dir  = os.path.dirname(os.path.abspath(__file__)) + '/'
+repos_dir  = os.path.dirname(bench_dir.rstrip('/')) + '/'
+baseline   = bench_dir + 'baseline.json'
+
+# Modules that must not be loaded just by importing the package #
+forbidden = ['sh', 'subprocess', 'shutil', 'sqlite3', 'gzip', 'zipfile',
+             'tempfile', 'hashlib', 'concurrent.futures', 'csv']
+
+################################################################################
+def time_import(runs=20):
+    """Median wall time of `import pydirdiff` in a fresh interpreter,
+    minus the time of an interpreter that imports nothing."""
+    def median_of(code):
+        timings = []
+        for i in range(runs):
+            start = time.perf_counter()
+            subprocess.check_call([sys.executable, '-c', code], cwd=repos_dir)
+            timings.append(time.perf_counter() - start)
+        timings.sort()
+        return timings[len(timings) // 2]
+    return max(0.0, median_of('import pydirdiff') - median_of('pass'))
+
+def loaded_modules():
+    """Which of the forbidden modules are loaded by the import."""
+    code = "import sys, pydirdiff; print(' '.join(sys.modules))"
+    modules = subprocess.check_output([sys.executable, '-c', code], cwd=repos_dir)
+    modules = modules.decode().split()
+    return [m for m in forbidden if m in modules]
+
+################################################################################
+if __name__ == '__main__':
+    # Arguments #
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--save', action='store_true', help="Store the result as the new baseline")
+    parser.add_argument('--tolerance', type=float, default=1.5, help="Allowed slowdown factor")
+    args = parser.parse_args()
+    # Load the previous results #
+    results = {}
+    if os.path.exists(baseline):
+        with open(baseline) as handle: results = json.load(handle)
+    # Measure #
+    seconds = time_import()
+    modules = loaded_modules()
+    print("Import time: %.1f ms" % (seconds * 1000))
+    # Save #
+    if args.save:
+        results['startup'] = {'import_seconds': round(seconds, 4)}
+        with open(baseline, 'w') as handle: json.dump(results, handle, indent=4, sort_keys=True)
+        print("Saved to '%s'." % baseline)
+        sys.exit(0)
+    # Check #
+    failed = False
+    if modules:
+        print("Importing loaded optional modules: %s" % ', '.join(modules))
+        failed = True
+    reference = results.get('startup', {}).get('import_seconds')
+    if reference is not None:
+        print("Baseline:    %.1f ms" % (reference * 1000))
+        if seconds > reference * args.tolerance + 0.005:
+            print("Import time regressed by more than %.1fx." % args.tolerance)
+            failed = True
+    sys.exit(1 if failed else 0)
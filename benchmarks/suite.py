@@ -0,0 +1,141 @@
+#!/usr/bin/env python
+
+"""
+Regression benchmark for whole comparisons on synthetic directory pairs.
+
+Run it from the root of the repository like this:
+
+    $ python3 benchmarks/suite.py
+    $ python3 benchmarks/suite.py --save
+    $ python3 benchmarks/suite.py --scale=0.1 --scenario=wide --scenario=deep
+
+Every scenario of `benchmarks/trees.py` is generated in a temporary
+directory and compared twice, each time in a fresh interpreter so that the
+peak memory of one doesn't hide the other. The first run only looks at
+sizes and dates, which times the traversal. The second one checks the
+contents with `md5`, the difference between the two is the hashing phase.
+The number of differences found must match the ones injected. Timings and
+peak memory are compared to the values stored in `benchmarks/baseline.json`
+and the script exits with an error if any got worse by more than the
+tolerance.
+"""
+
+# Built-in modules #
+import os, sys, json, time, shutil, argparse, tempfile, subprocess
+
+# Constants #
+bench_dir  = os.path.dirname(os.path.abspath(__file__)) + '/'
+repos_dir  = os.path.dirname(bench_dir.rstrip('/')) + '/'
+baseline   = bench_dir + 'baseline.json'
+
+# The generator sits next to this file #
+sys.path.insert(0, bench_dir)
+from trees import scenarios
+
+# The two phases and the comparison function each one uses #
+phases = [('walk', 'sizes_only'), ('full', 'md5')]
+
+# Measured in the child process, printed as JSON #
+child_code = """
+import sys, json, time, pydirdiff
+from pydirdiff.plumbing.common import peak_memory
+analysis = pydirdiff.Analysis(sys.argv[1], sys.argv[2], cmp_fn=sys.argv[3], verbose=False)
+start = time.perf_counter()
+count = sum(1 for diff in analysis.differences())
+print(json.dumps({'seconds': time.perf_counter() - start,
+                  'count':   count,
+                  'errors':  analysis.errors,
+                  'peak':    peak_memory()}))
+"""
+
+################################################################################
+def run_phase(expected, cmp_fn):
+    """Compare the two trees in a fresh interpreter and return its
+    measurements."""
+    command = [sys.executable, '-c', child_code, expected['first'], expected['secnd'], cmp_fn]
+    output  = subprocess.check_output(command, cwd=repos_dir)
+    return json.loads(output.decode().strip().split('\n')[-1])
+
+def run_scenario(scenario, directory, scale, seed):
+    """Generate the trees of a scenario, time both phases and check
+    the number of differences found."""
+    # Generated in another process too, since the peak memory #
+    # of a process carries over to the children it starts     #
+    start    = time.perf_counter()
+    command  = [sys.executable, bench_dir + 'trees.py', scenario, directory,
+                '--scale=%g' % scale, '--seed=%i' % seed]
+    expected = json.loads(subprocess.check_output(command).decode())
+    print("%-12s generated %i entries in %.1f s" %
+          (scenario, expected['entries'], time.perf_counter() - start))
+    measured = {name: run_phase(expected, cmp_fn) for name, cmp_fn in phases}
+    walk, full = measured['walk'], measured['full']
+    hashing    = max(full['seconds'] - walk['seconds'], 1e-6)
+    peak       = max(phase['peak'] or 0 for phase in measured.values())
+    result = {'walk_seconds':     round(walk['seconds'], 4),
+              'full_seconds':     round(full['seconds'], 4),
+              'files_per_second': round(expected['entries'] / max(walk['seconds'], 1e-6)),
+              'mb_per_second':    round(expected['read_bytes'] / hashing / 1048576.0, 1),
+              'peak_mib':         round(peak / 1048576.0, 1)}
+    print("%-12s walk %.3f s (%i entries/s), full %.3f s (%.1f MB/s hashing), peak %.1f MiB" %
+          (scenario, result['walk_seconds'], result['files_per_second'],
+           result['full_seconds'], result['mb_per_second'], result['peak_mib']))
+    # Correctness #
+    problems = []
+    if full['count'] != expected['differences']:
+        problems.append("found %i differences instead of %i" % (full['count'], expected['differences']))
+    if full['errors'] or walk['errors']:
+        problems.append("%i errors" % (full['errors'] + walk['errors']))
+    return result, problems
+
+def regressions(result, reference, tolerance):
+    """The measurements that got worse than the reference."""
+    found = []
+    for key in ('walk_seconds', 'full_seconds', 'peak_mib'):
+        if key not in reference: continue
+        # A small absolute margin so that tiny timings don't flake #
+        margin = 0.05 if key.endswith('seconds') else 2.0
+        if result[key] > reference[key] * tolerance + margin:
+            found.append("%s %s > %s" % (key, result[key], reference[key]))
+    return found
+
+################################################################################
+if __name__ == '__main__':
+    # Arguments #
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--save', action='store_true', help="Store the results as the new baseline")
+    parser.add_argument('--tolerance', type=float, default=1.5, help="Allowed slowdown factor")
+    parser.add_argument('--scale', type=float, default=1.0, help="Multiply the number of entries")
+    parser.add_argument('--seed', type=int, default=0, help="Seed of the tree generator")
+    parser.add_argument('--scenario', action='append', choices=sorted(scenarios),
+                        help="Only run this scenario, can be repeated")
+    parser.add_argument('--directory', help="Where to generate the trees instead of a"
+                                            " temporary directory, kept afterwards")
+    args = parser.parse_args()
+    # Load the previous results #
+    results = {}
+    if os.path.exists(baseline):
+        with open(baseline) as handle: results = json.load(handle)
+    # Results only compare to a baseline made with the same trees #
+    key = 'suite' if args.scale == 1.0 and args.seed == 0 else 'suite-%g-%i' % (args.scale, args.seed)
+    references = results.get(key, {})
+    # Measure #
+    workspace = args.directory or tempfile.mkdtemp(prefix='pydirdiff-bench-')
+    measured, failed = {}, False
+    try:
+        for scenario in args.scenario or list(scenarios):
+            directory = os.path.join(workspace, scenario)
+            if os.path.exists(directory): shutil.rmtree(directory)
+            measured[scenario], problems = run_scenario(scenario, directory, args.scale, args.seed)
+            if not args.save and scenario in references:
+                problems += regressions(measured[scenario], references[scenario], args.tolerance)
+            for problem in problems: print("%-12s FAILED: %s" % (scenario, problem))
+            failed = failed or bool(problems)
+    finally:
+        if not args.directory: shutil.rmtree(workspace)
+    # Save #
+    if args.save:
+        if failed: sys.exit("Not saving results of a failed run.")
+        results.setdefault(key, {}).update(measured)
+        with open(baseline, 'w') as handle: json.dump(results, handle, indent=4, sort_keys=True)
+        print("Saved to '%s'." % baseline)
+    sys.exit(1 if failed else 0)
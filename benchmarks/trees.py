@@ -0,0 +1,176 @@
+#!/usr/bin/env python
+
+"""
+Deterministic generator of synthetic directory pairs for the benchmarks.
+
+Every scenario builds a first tree, copies it to a second tree with the
+same modification times, and then injects divergences in the second tree.
+The same scenario, scale and seed always give the same trees. Use it like
+this:
+
+    $ python3 benchmarks/trees.py small_files /tmp/bench --scale=0.1
+
+Or from python:
+
+    expected = generate('wide', '/tmp/bench')
+    print(expected['differences'])
+"""
+
+# Built-in modules #
+import os, sys, json, random, shutil, argparse
+
+# Scenarios and their parameters at scale 1 #
+scenarios = {
+    # Many directories of small files #
+    'small_files': dict(dirs=100, files=100, sizes=(0, 8192)),
+    # A few files large enough for the hashing speed to dominate, #
+    # the scale changes their size instead of their number        #
+    'huge_files':  dict(dirs=1, files=4, sizes=(64 << 20, 64 << 20), scale_sizes=True),
+    # A single chain of nested directories #
+    'deep':        dict(depth=400, files=2, sizes=(0, 1024)),
+    # A single directory with many entries #
+    'wide':        dict(dirs=1, files=20000, sizes=(0, 256)),
+    # Symbolic links to files and directories, some pointing elsewhere #
+    'symlinks':    dict(dirs=20, files=50, links=50, sizes=(0, 1024)),
+}
+
+# One in this many files gets a divergence injected #
+rate = 25
+
+################################################################################
+def write_file(path, size, rng):
+    """Write `size` pseudo-random bytes. Large files repeat a block
+    with a different header every time, which is fast to write but
+    still has to be read entirely to be compared."""
+    block = rng.getrandbits(8 * min(size, 1 << 20)).to_bytes(min(size, 1 << 20), 'little')
+    with open(path, 'wb') as handle:
+        written = 0
+        while written < size:
+            chunk = block[:size - written]
+            header = written.to_bytes(8, 'little')[:len(chunk)]
+            handle.write(header + chunk[len(header):])
+            written += len(chunk)
+
+def copy_tree(first, secnd):
+    """Copy a tree with the same modification times, keeping symlinks."""
+    for root, dirs, files in os.walk(first):
+        target = secnd + root[len(first):]
+        os.makedirs(target, exist_ok=True)
+        for name in dirs + files:
+            source = os.path.join(root, name)
+            if os.path.islink(source):
+                os.symlink(os.readlink(source), os.path.join(target, name))
+                # os.walk lists symlinks to directories but doesn't follow them #
+                continue
+            if name in files:
+                shutil.copyfile(source, os.path.join(target, name))
+                stat = os.stat(source)
+                os.utime(os.path.join(target, name), ns=(stat.st_atime_ns, stat.st_mtime_ns))
+
+def layout(scenario, scale):
+    """The relative directories and the `(directory, name)` files of a scenario."""
+    params = scenarios[scenario]
+    if params.get('scale_sizes'): scale = 1.0
+    count  = lambda key: max(1, int(params.get(key, 0) * scale))
+    if scenario == 'deep':
+        dirs = ['/'.join(['level%i' % i for i in range(depth + 1)]) for depth in range(count('depth'))]
+    else:
+        dirs = ['dir%i' % i for i in range(count('dirs'))]
+    files = [(directory, 'file%i.bin' % i) for directory in dirs for i in range(params['files'])]
+    if scenario in ('wide', 'huge_files'):
+        files = [(dirs[0], 'file%i.bin' % i) for i in range(count('files'))]
+    return dirs, files
+
+################################################################################
+def generate(scenario, directory, scale=1.0, seed=0):
+    """
+    Build the trees `first` and `secnd` of a scenario inside `directory`.
+    Returns what the comparison should find: the number of differences
+    reported with the default options, the number of entries and the
+    number of bytes that have to be read to compare file contents.
+    """
+    rng = random.Random("%s-%i" % (scenario, seed))
+    first, secnd = os.path.join(directory, 'first'), os.path.join(directory, 'secnd')
+    dirs, files = layout(scenario, scale)
+    low, high = scenarios[scenario]['sizes']
+    if scenarios[scenario].get('scale_sizes'): low, high = int(low * scale), int(high * scale)
+    # The first tree #
+    sizes = {}
+    for relative in dirs: os.makedirs(os.path.join(first, relative))
+    for relative, name in files:
+        path = os.path.join(first, relative, name)
+        sizes[path[len(first):]] = size = rng.randint(low, high)
+        write_file(path, size, rng)
+        os.utime(path, ns=(10**18, 10**18 + rng.randint(0, 10**9)))
+    # Symbolic links #
+    links = []
+    for i in range(int(scenarios[scenario].get('links', 0) * scale)):
+        relative = rng.choice(dirs)
+        target = rng.choice(files)[1] if i % 5 else '../' + rng.choice(dirs)
+        links.append(os.path.join(relative, 'link%i' % i))
+        os.symlink(target, os.path.join(first, links[-1]))
+    # The second tree #
+    copy_tree(first, secnd)
+    # Divergences #
+    expected = 0
+    for i, relative in enumerate(sorted(sizes)):
+        if i % rate: continue
+        path = secnd + relative
+        kind = (i // rate) % 5
+        if kind == 0:
+            os.remove(path)
+            del sizes[relative]
+        elif kind == 1:
+            path += '.new'
+            write_file(path, rng.randint(low, high), rng)
+        elif kind == 2:
+            with open(path, 'ab') as handle: handle.write(b'x')
+            del sizes[relative]
+        elif kind == 3:
+            if sizes[relative] == 0: continue
+            with open(path, 'r+b') as handle:
+                first_byte = handle.read(1)
+                handle.seek(0)
+                handle.write(b'\xff' if first_byte != b'\xff' else b'\x00')
+        elif kind == 4:
+            expected -= 1
+        # Dates are part of the trees too #
+        if kind: os.utime(path, ns=(10**18, 10**18 - i))
+        expected += 1
+    for i, relative in enumerate(links):
+        if i % 3: continue
+        # Point to another entry of the same kind #
+        path   = os.path.join(secnd, relative)
+        target = os.readlink(path)
+        others = ['../' + d for d in dirs] if i % 5 == 0 else sorted(set(f[1] for f in files))
+        others = [other for other in others if other != target]
+        if not others: continue
+        os.remove(path)
+        os.symlink(rng.choice(others), path)
+        expected += 1
+    # Directories and links got the date they were last written #
+    for tree in (first, secnd):
+        for root, subdirs, names in os.walk(tree, topdown=False):
+            for name in names + subdirs:
+                path = os.path.join(root, name)
+                if os.path.islink(path): os.utime(path, ns=(10**18, 10**18), follow_symlinks=False)
+            os.utime(root, ns=(10**18, 10**18))
+    # What the benchmark needs to know #
+    return {'scenario':    scenario,
+            'first':       first,
+            'secnd':       secnd,
+            'differences': expected,
+            'entries':     2 * (len(files) + len(dirs) + len(links)),
+            'read_bytes':  2 * sum(sizes.values())}
+
+################################################################################
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('scenario', choices=sorted(scenarios))
+    parser.add_argument('directory', help="Where to create the trees, must not exist")
+    parser.add_argument('--scale', type=float, default=1.0, help="Multiply the number of entries")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    os.makedirs(args.directory)
+    json.dump(generate(args.scenario, args.directory, args.scale, args.seed), sys.stdout, indent=4)
+    print()
@@ -3,14 +3,29 @@ __version__ = '1.2.1'
 version_string = "version %s" % __version__
 
 # Built-in modules #
-import sys, os
+import sys, os, time, threading, functools
+from datetime import datetime
+from collections import deque
+from contextlib import redirect_stdout, nullcontext
 
 # First party modules #
-from pydirdiff.plumbing.common     import md5sum, natural_sort, sanitize_text
+from pydirdiff.plumbing.common     import name_key, sanitize_text, merge_listings
+from pydirdiff.plumbing.common     import file_digest, hash_modules, hash_available
+from pydirdiff.plumbing.common     import bytes_identical, sample_identical, sample_coverage
+from pydirdiff.plumbing.common     import peak_memory, physical_offset
 from pydirdiff.plumbing.autopaths  import DirectoryPath
 from pydirdiff.plumbing.timer      import Timer
+from pydirdiff.plumbing.stats      import Stats
 from pydirdiff.plumbing.color      import Color
 from pydirdiff.plumbing.git        import GitRepo
+from pydirdiff.manifest            import Manifest, ManifestEntry
+from pydirdiff.difference          import Difference
+from pydirdiff.moves               import MoveDetector, walk_files, partial_fingerprint
+from pydirdiff.moves               import directory_tokens, match_directories
+from pydirdiff.spill               import SpilledListing, SpilledEntry, entries, merge_entries
+
+# Other modules are imported only when needed, so that importing #
+# this package stays cheap and never starts a subprocess.        #
 
 # This module #
 import pydirdiff
@@ -26,15 +41,46 @@ else:                                   git_repo = None
 
 ################################################################################
 # Comparison functions
-def sizes_only(path): return os.path.getsize(path)
-def md5(path):        return md5sum(path)
+def sizes_only(path, blocksize=None, reader=None): return os.path.getsize(path)
 
-# Dictionary to hold them
+def hash_fn(algorithm):
+    """Make a comparison function that returns the digest of a file."""
+    def fn(path, blocksize=65536, reader=None): return file_digest(path, algorithm, blocksize, reader)
+    fn.__name__ = algorithm
+    return fn
+
+# Dictionary to hold them, one per hash algorithm #
 comparison_fns = {
  'sizes_only': sizes_only,
- 'md5':        md5,
+}
+comparison_fns.update((name, hash_fn(name)) for name in hash_modules)
+md5 = comparison_fns['md5']
+
+# Pairwise functions look at both files at once and return True if identical #
+def bytewise(first, secnd, blocksize=1048576, reader=None):
+    return bytes_identical(first, secnd, blocksize, reader)
+def sample(first, secnd, samples=16, seed=0, reader=None):
+    return sample_identical(first, secnd, samples=samples, seed=seed, reader=reader)
+
+# Dictionary to hold them
+pairwise_fns = {
+ 'bytes':  bytewise,
+ 'sample': sample,
 }
 
+# Symbolic links can come from the disk or from a manifest #
+def readlink(entry):
+    if isinstance(entry, ManifestEntry): return entry.link
+    return os.readlink(entry.path)
+
+# Files are read in the order of their place on the disk: by device, then #
+# by physical offset if the filesystem tells it, otherwise by inode       #
+def disk_order(entry):
+    if isinstance(entry, ManifestEntry): return (0, -1, 0)
+    stat   = entry.stat(follow_symlinks=False)
+    offset = physical_offset(entry.path)
+    return (stat.st_dev, -1 if offset is None else offset, stat.st_ino)
+
 ################################################################################
 class Analysis(object):
     """The main object that does everything."""
@@ -52,164 +98,1073 @@ class Analysis(object):
                  cmp_fn        = 'md5',
                  ignore        = None,
                  debug         = False,
+                 jobs          = 1,
+                 cache         = None,
+                 listers       = 2,
+                 format        = 'text',
+                 refresh       = 0.2,
+                 detect_moves  = False,
+                 rename_threshold = None,
+                 samples       = 16,
+                 seed          = 0,
+                 blocksize     = None,
+                 max_entries   = None,
+                 spill_dir     = None,
+                 resume        = None,
+                 baseline      = None,
+                 changes       = None,
+                 processes     = 1,
+                 stats         = False,
+                 stats_file    = None,
+                 readahead     = None,
+                 mmap          = False,
+                 schedule      = None,
+                 concurrency   = None,
+                 bandwidth     = None,
+                 ionice        = None,
                  ):
+        # Remembered to build the same analysis in worker processes #
+        self.arguments = dict(locals())
+        del self.arguments['self']
+        # Either side can be a manifest instead of a directory #
+        self.first_manifest = Manifest(first_dir) if Manifest.is_manifest(first_dir) else None
+        self.secnd_manifest = Manifest(secnd_dir) if Manifest.is_manifest(secnd_dir) else None
+        if self.first_manifest: first_dir = self.first_manifest.root
+        if self.secnd_manifest: secnd_dir = self.secnd_manifest.root
         # Base parameters #
         self.first_dir = DirectoryPath(first_dir)
         self.secnd_dir = DirectoryPath(secnd_dir)
         # Check #
-        self.first_dir.must_exist()
-        self.secnd_dir.must_exist()
+        if not self.first_manifest: self.first_dir.must_exist()
+        if not self.secnd_manifest: self.secnd_dir.must_exist()
+        # How to list each side #
+        self.first_list = self.first_manifest.flat_contents if self.first_manifest else self.flat_contents
+        self.secnd_list = self.secnd_manifest.flat_contents if self.secnd_manifest else self.flat_contents
         # Attributes #
         self.skip_dsstore = skip_dsstore
         self.skip_dates   = skip_dates
         self.verbose      = verbose
         self.ignore       = ignore
         self.debug        = debug
+        self.jobs         = int(jobs)
+        self.cache_path   = cache
+        self.listers      = int(listers)
+        self.format       = format
+        self.refresh      = float(refresh)
+        self.detect_moves = detect_moves
+        self.rename_threshold = None if rename_threshold is None else float(rename_threshold)
+        self.samples      = int(samples)
+        self.seed         = int(seed)
+        self.blocksize    = None if blocksize is None else int(blocksize)
+        self.max_entries  = None if max_entries is None else int(max_entries)
+        self.spill_path   = spill_dir
+        self.state_path   = resume
+        self.baseline_path = baseline
+        self.changes_path  = changes
+        self.processes     = int(processes)
+        self.readahead     = None if readahead is None else int(readahead)
+        self.mmap          = mmap
+        self.schedule      = None if schedule is None else int(schedule)
+        self.ionice        = ionice
+        # Production volumes can be scanned at a limited pace #
+        self.limits = None
+        if concurrency is not None or bandwidth is not None:
+            from pydirdiff.throttle import TreeLimit, per_tree
+            pairs = zip(per_tree(concurrency, int), per_tree(bandwidth, float))
+            self.limits = [TreeLimit(*pair) for pair in pairs]
+            self.first_list = functools.partial(self.limited_list, self.limits[0], self.first_list)
+            self.secnd_list = functools.partial(self.limited_list, self.limits[1], self.secnd_list)
+        self.reader        = None
+        # Every phase is measured when asked, including the listings #
+        self.stats_report  = stats
+        self.stats_path    = stats_file
+        self.stats         = Stats() if stats or stats_file else None
+        if self.stats:
+            self.first_list = functools.partial(self.timed_list, self.first_list, 'first')
+            self.secnd_list = functools.partial(self.timed_list, self.secnd_list, 'secnd')
         # Other #
-        self.count  = 0
-        self.errors = 0
+        self.count    = 0
+        self.errors   = 0
+        self.scanning = False
+        # Set in worker processes only #
+        self.shard    = None
+        self.deadline = None
+        self.leftover = []
+        # How much of the files was read when sampling #
+        self.sampled_bytes = 0
+        self.sampled_total = 0
+        self.sampled_lock  = threading.Lock()
         # Check the comparison function exists #
-        if cmp_fn not in comparison_fns:
+        if cmp_fn not in comparison_fns and cmp_fn not in pairwise_fns:
             raise Exception("The option '%s' is not a valid comparison function." % cmp_fn)
+        if cmp_fn in hash_modules and not hash_available(cmp_fn):
+            raise Exception("The '%s' comparison function needs the '%s' package." %
+                            (cmp_fn, hash_modules[cmp_fn]))
         # Pick a comparison function #
-        self.cmp_fn = comparison_fns[cmp_fn]
+        self.cmp_name = cmp_fn
+        self.pairwise = cmp_fn in pairwise_fns
+        if self.pairwise: self.cmp_fn = pairwise_fns[cmp_fn]
+        else:             self.cmp_fn = comparison_fns[cmp_fn]
+        # Sampling has its own parameters #
+        if cmp_fn == 'sample':
+            self.cmp_fn = lambda first, secnd, reader=None: \
+                          sample(first, secnd, self.samples, self.seed, reader)
+        # The others can read with a different block size #
+        elif self.blocksize:
+            self.cmp_fn = functools.partial(self.cmp_fn, blocksize=self.blocksize)
+        # The cache can only store digests and must never be in the directories #
+        if cache is not None:
+            if self.pairwise or cmp_fn == 'sizes_only':
+                raise Exception("The cache can't be used with the '%s' comparison function." % cmp_fn)
+            cache_path = os.path.realpath(os.path.expanduser(cache))
+            for directory in (self.first_dir, self.secnd_dir):
+                if cache_path.startswith(os.path.realpath(directory) + '/'):
+                    raise Exception("The cache file can't be inside '%s'." % directory)
+        # Huge listings are spilled to disk, but never inside the directories #
+        if self.max_entries is not None:
+            import tempfile
+            if self.spill_path is None: self.spill_path = tempfile.gettempdir()
+            spill_path = os.path.realpath(os.path.expanduser(self.spill_path))
+            for directory in (self.first_dir, self.secnd_dir):
+                if (spill_path + '/').startswith(os.path.realpath(directory) + '/'):
+                    raise Exception("The spill directory can't be inside '%s'." % directory)
+        # The state file must never be in the directories either #
+        if resume is not None:
+            state_path = os.path.realpath(os.path.expanduser(resume))
+            for directory in (self.first_dir, self.secnd_dir):
+                if state_path.startswith(os.path.realpath(directory) + '/'):
+                    raise Exception("The state file can't be inside '%s'." % directory)
+        # The baseline remembers what every directory pair looked like #
+        if changes is not None and baseline is None:
+            raise Exception("A change feed can only be used together with a baseline.")
+        if baseline is not None:
+            if self.first_manifest or self.secnd_manifest:
+                raise Exception("A baseline can't be used with a manifest.")
+            if detect_moves or resume is not None:
+                raise Exception("A baseline can't be used with move detection or a state file.")
+            baseline_path = os.path.realpath(os.path.expanduser(baseline))
+            for directory in (self.first_dir, self.secnd_dir):
+                if baseline_path.startswith(os.path.realpath(directory) + '/'):
+                    raise Exception("The baseline file can't be inside '%s'." % directory)
+        # Memory maps and read-ahead are two different ways of reading #
+        if mmap and self.readahead:
+            raise Exception("Memory maps can't be used together with read-ahead.")
+        # Worker processes don't share anything with each other #
+        if self.processes > 1:
+            if detect_moves or cache is not None or resume is not None or baseline is not None:
+                raise Exception("Several processes can't be used with move detection,"
+                                " a cache, a state file or a baseline.")
+            if concurrency is not None or bandwidth is not None:
+                raise Exception("Several processes can't share concurrency or bandwidth limits.")
+        # Check the output format exists #
+        if format != 'text':
+            from pydirdiff.formats import record_writers
+            if format not in record_writers:
+                raise Exception("The option '%s' is not a valid output format." % format)
+            # Machine readable formats never display the scanning line #
+            self.verbose = False
+        # The I/O priority is only applied to the workers, when comparing #
+        if ionice is not None:
+            from pydirdiff.throttle import check_ionice
+            check_ionice(ionice)
+        # Manifests only remember digests, not the file contents #
+        if (self.first_manifest or self.secnd_manifest) and self.pairwise:
+            raise Exception("A manifest can't be used with the '%s' comparison function." % cmp_fn)
+        # And only the digests of the algorithm they were written with #
+        for manifest in (self.first_manifest, self.secnd_manifest):
+            if manifest is None or cmp_fn == 'sizes_only' or manifest.algo == cmp_fn: continue
+            if manifest.algo is None: recorded = "no digests"
+            else:                     recorded = "'%s' digests" % manifest.algo
+            raise Exception("The manifest '%s' has %s, it can't be compared with the '%s'"
+                            " comparison function. Use `sizes_only` or write the manifest"
+                            " with `--cmp_fn=%s`." % (manifest.path, recorded, cmp_fn, cmp_fn))
 
     def run(self):
-        """A method to run the whole comparison."""
+        """
+        A method to run the whole comparison. With a machine readable
+        format, the records go to the standard output and all the other
+        messages go to the standard error instead. If whatever reads the
+        output stops early, like `head` does, the comparison stops quietly.
+        """
+        try:
+            if self.format == 'text': return self.run_comparison()
+            from pydirdiff.formats import record_writers
+            self.writer = record_writers[self.format]()
+            try:
+                with redirect_stdout(sys.stderr): self.run_comparison()
+            finally:
+                self.writer.close()
+        except BrokenPipeError:
+            # Anything still buffered goes nowhere instead of failing again at exit #
+            devnull = os.open(os.devnull, os.O_WRONLY)
+            os.dup2(devnull, sys.stdout.fileno())
+            sys.exit(1)
+
+    def run_comparison(self):
+        """Print the messages around the comparison and do it."""
         # Intro messages #
         print(str(pydirdiff))
         print(version_string + " (pid %i)" % os.getpid())
-        if git_repo: print("The exact version of the codebase is: " + git_repo.short_hash)
+        if git_repo: print("The exact version of the codebase is: " + git_repo.head_short_hash)
         # Time the pipeline execution #
         self.timer = Timer()
         self.timer.print_start()
         # Recap both directories #
         print("------------")
         print('First directory: "%s"' % self.first_dir)
+        if self.first_manifest: print('  (from manifest "%s")' % self.first_manifest.path)
         print('Secnd directory: "%s"' % self.secnd_dir)
+        if self.secnd_manifest: print('  (from manifest "%s")' % self.secnd_manifest.path)
         # Recap the ignore parameter #
         if self.ignore: print('Ignoring all directories named: "%s"' % self.ignore)
+        # Recap the move detection parameter #
+        if self.detect_moves: print('Detecting moved and renamed files.')
+        if self.rename_threshold is not None:
+            print('Detecting renamed directories above %.2f similarity.' % self.rename_threshold)
+        # Recap the cache parameter #
+        if self.cache_path: print('Checksum cache: "%s"' % self.cache_path)
+        # Recap the resume parameter #
+        if self.state_path:
+            resuming = os.path.exists(os.path.expanduser(self.state_path))
+            print('%s "%s"' % ('Resuming from:' if resuming else 'Checkpointing to:', self.state_path))
+        # Recap the incremental parameters #
+        if self.baseline_path: print('Baseline: "%s"' % self.baseline_path)
+        if self.changes_path:  print('Change feed: "%s"' % self.changes_path)
+        # Recap the production-safe parameters #
+        if self.limits:
+            for name, limit in zip(('First', 'Secnd'), self.limits):
+                print('%s directory: at most %s operations at once and %s MB/s.' %
+                      (name, limit.concurrency or 'any', limit.bandwidth or 'any'))
+        if self.ionice is not None: print('I/O priority: %s' % self.ionice)
+        # Recap the low memory parameter #
+        if self.max_entries is not None:
+            print('Spilling directories of more than %i entries to "%s".' %
+                  (self.max_entries, self.spill_path))
         print("------------")
         # Get and update the terminal length #
-        self.rows, self.columns = map(int, os.popen('stty size', 'r').read().split())
+        if self.format == 'text':
+            try: self.columns, self.rows = os.get_terminal_size(sys.stdout.fileno())
+            except (OSError, ValueError, AttributeError):
+                self.columns, self.rows = 120, 24
+        else:
+            self.rows, self.columns = 0, 12
+        # The scanning line is only useful on an interactive terminal #
+        self.scanning = self.verbose and sys.stdout.isatty()
+        self.last_refresh = 0.0
         # Do it #
-        self.compare_two_dirs(self.first_dir.rstrip('/'), self.secnd_dir.rstrip('/'))
+        for diff in self.differences():
+            with self.measure('display'): self.display(diff)
         # Clear scanning line at the end #
-        if self.verbose:
+        if self.scanning:
             sys.stdout.write('\r')
             sys.stdout.flush()
         print("------------" + " " * (self.columns - 12))
         # End message #
         if self.errors == 0: print("Success.")
         else:                print("Success (with non-fatal errors).")
+        # Cache usage #
+        if self.cache:
+            print("Checksum cache: %i hits, %i misses." % (self.cache.hits, self.cache.misses))
+        # Baseline usage #
+        if self.baseline:
+            print("Baseline: %i directory pairs trusted, %i compared." %
+                  (self.baseline.trusted, self.baseline.checked))
+        # Sampling coverage #
+        if self.cmp_name == 'sample' and self.sampled_total:
+            print("Sampling read %.2f%% of the %i bytes of files with diverging dates." %
+                  (100.0 * self.sampled_bytes / self.sampled_total, self.sampled_total))
         # Special summary message #
         if self.count == 0:
             print(Color.bold + "The two directories were perfectly identical." + Color.end)
         else:
             print("There were %i differences between the two directories." % self.count)
+        # Memory used #
+        peak = peak_memory()
+        if peak is not None: print("Peak memory usage: %.1f MiB." % (peak / 1048576.0))
+        # Where the time went #
+        if self.stats_report:
+            print("------------")
+            self.stats.print_report()
+        if self.stats_path:
+            elapsed = (datetime.now() - self.timer.start_time).total_seconds()
+            self.stats.dump(self.stats_path, seconds=elapsed, peak_memory=peak,
+                            differences=self.count, errors=self.errors)
+            print('Statistics written to "%s".' % self.stats_path)
         # Time elapsed #
         self.timer.print_end()
         self.timer.print_total_elapsed()
 
-    def compare_two_dirs(self, root1, root2):
-        """Just one directory pair. This is called recursively."""
+    def differences(self):
+        """
+        Compare the two directories without printing anything, yielding
+        every difference found as a `Difference` object, in the same order
+        as the text output. The comparison progresses only as the generator
+        is consumed, so callers can filter, aggregate or stop early:
+
+            analysis = Analysis('/Volumes/Original/', '/Volumes/Copy/')
+            for diff in analysis.differences():
+                if diff.is_error: break
+        """
+        # Differences ready to be handed out #
+        self.ready = deque()
+        # Counters start over when the same analysis is run again #
+        self.count, self.errors = 0, 0
+        self.sampled_bytes, self.sampled_total = 0, 0
+        self.spill_warned = False
+        # The work can be split between processes instead #
+        if self.processes > 1:
+            yield from self.sharded()
+            return
+        # Only the threads doing the I/O get a lower priority, not the caller #
+        from pydirdiff.throttle import set_ionice
+        if self.ionice is None: init = {}
+        else:                   init = dict(initializer=set_ionice, initargs=(self.ionice,))
+        # Content checks are done in the background by these workers #
+        from concurrent.futures import ThreadPoolExecutor
+        self.pending   = deque()
+        self.in_flight = 0
+        self.batch     = []
+        self.pool      = ThreadPoolExecutor(max_workers=self.jobs, **init)
+        self.side_pool = ThreadPoolExecutor(max_workers=self.jobs, **init)
+        # Directory listings are fetched ahead by these workers #
+        self.list_pool = ThreadPoolExecutor(max_workers=self.listers, **init)
+        # File blocks are requested ahead, enough for every file being read #
+        from pydirdiff.plumbing.readahead import ReadAhead, MappedReader
+        if self.readahead: self.reader = ReadAhead(2 * self.jobs * self.readahead, self.readahead, **init)
+        elif self.mmap:    self.reader = MappedReader()
+        else:              self.reader = None
+        # Reads are slowed down to respect the limits of each tree #
+        from pydirdiff.throttle import ThrottledReader
+        if self.limits:
+            roots = {str(self.first_dir): self.limits[0], str(self.secnd_dir): self.limits[1]}
+            self.reader = ThrottledReader(roots, self.reader)
+        # Digests of unchanged files are remembered between runs #
+        from pydirdiff.cache import ChecksumCache
+        if self.cache_path: self.cache = ChecksumCache(self.cache_path)
+        else:               self.cache = None
+        # Huge listings are written in this temporary directory #
+        if self.max_entries is not None:
+            import tempfile
+            self.spill_dir = tempfile.mkdtemp(prefix='pydirdiff-', dir=self.spill_path)
+        # One-sided files and directories are kept to find moves afterwards #
+        self.moves, self.moved_dirs = None, []
+        if self.detect_moves:
+            # Manifests can only give a full digest, not a partial one #
+            if self.first_manifest or self.secnd_manifest:
+                self.moves = MoveDetector(self.move_digest, partial_fn=None)
+            else:
+                self.moves = MoveDetector(self.move_digest, partial_fn=self.move_fingerprint)
+        # Progress is saved regularly so that an interrupted run can resume #
+        from pydirdiff.checkpoint import Checkpoint
+        if self.state_path: self.state = Checkpoint(self.state_path, self.signature())
+        else:               self.state = None
+        finished = False
+        # Only what changed since the baseline is compared again #
+        from pydirdiff.baseline import Baseline, ChangeFeed
+        if self.baseline_path: self.baseline = Baseline(self.baseline_path, self.signature())
+        else:                  self.baseline = None
+        if self.changes_path:  self.changes = ChangeFeed(self.changes_path)
+        else:                  self.changes = None
+        # The feed has resolved paths, ours start like the arguments given #
+        self.real_tops = [(str(top).rstrip('/'), os.path.realpath(top).rstrip('/'))
+                          for top in (self.first_dir, self.secnd_dir)]
+        self.current = None
+        # Do it #
+        try:
+            pairs = [[self.first_dir.rstrip('/'), self.secnd_dir.rstrip('/')]]
+            if self.shard is not None: pairs = self.shard
+            if self.state and self.state.started:
+                pairs = self.state.frontier()
+                for diff in self.resume(): yield diff
+            for diff in self.compare_two_dirs(pairs): yield diff
+            if self.state: self.state.save([])
+            if self.moves:
+                for diff in self.find_moves(): yield diff
+            finished = True
+        # Also when the caller stops early #
+        finally:
+            for pool in (self.pool, self.side_pool, self.list_pool):
+                pool.shutdown(wait=True, cancel_futures=True)
+            if self.reader: self.reader.close()
+            if self.cache: self.cache.close()
+            if self.state: self.state.close(finished)
+            if self.baseline: self.baseline.close(finished)
+            if self.max_entries is not None:
+                import shutil
+                shutil.rmtree(self.spill_dir, ignore_errors=True)
+
+    def compare_two_dirs(self, pairs):
+        """
+        Compare directory pairs and everything beneath them, yielding the
+        differences as soon as their turn has come. Instead of recursing,
+        the pairs still to be compared are kept on a stack, so that the
+        order is the same as a depth-first recursion. The last pair given
+        is compared first.
+        The listings of the pairs on top of the stack are fetched ahead of
+        time by the listing workers, both trees at the same time.
+        With a state file, the stack is saved as the frontier every now and
+        then, once every content check submitted so far is done.
+        With a baseline, the pairs that can be trusted aren't listed, their
+        differences are taken from the previous run.
+        """
+        stack = self.plan(pairs)
+        while stack:
+            if self.state and self.state.due:
+                self.flush(block=True)
+                self.state.save(stack)
+            self.prefetch(stack)
+            root1, root2, contents1, contents2, known = stack.pop()
+            self.current = root1
+            if known is not None:
+                subdirs = self.replay(root1, root2, known)
+            else:
+                with self.measure('wait_listing'):
+                    contents1, contents2 = contents1.result(), contents2.result()
+                if self.stats: self.stats.add('directory_pairs')
+                if isinstance(contents1, SpilledListing) or isinstance(contents2, SpilledListing):
+                    subdirs = yield from self.compare_spilled(root1, root2, contents1, contents2)
+                else:
+                    subdirs = self.compare_listings(root1, root2, contents1, contents2)
+                if self.baseline: self.remember(root1, root2, subdirs)
+            stack.extend(self.plan(reversed(subdirs)))
+            while self.ready: yield self.ready.popleft()
+            # In a worker process, hand the rest back after a while #
+            if self.deadline is not None and stack and time.time() > self.deadline:
+                self.leftover = [item[:2] for item in stack]
+                break
+        # Wait for the last content checks #
+        self.flush(block=True)
+        while self.ready: yield self.ready.popleft()
+
+    def sharded(self):
+        """
+        Split the comparison between worker processes. Every task given to
+        a worker is a directory pair, which it compares with everything
+        beneath for a fraction of a second. It then returns the differences
+        found and the pairs it didn't have time for (its stack), which
+        become new tasks. Idle workers pick the next task from the shared
+        queue, so a huge subtree ends up being spread between all of them.
+        Results are handed out in the same order as with a single process.
+        """
+        from concurrent.futures import ProcessPoolExecutor
+        self.cache, self.state, self.baseline = None, None, None
+        pool = ProcessPoolExecutor(self.processes, initializer=start_worker,
+                                   initargs=(self.arguments,))
+        # The first task only lists the top directories to split quickly #
+        root1, root2 = self.first_dir.rstrip('/'), self.secnd_dir.rstrip('/')
+        stack = [[root1, root2, pool.submit(run_shard, [[root1, root2]], 0.0)]]
+        try:
+            while stack:
+                root1, root2, future = stack.pop()
+                if self.scanning: self.print_current_dir(root1)
+                with self.measure('wait_workers'): diffs, leftover, sampled, stats = future.result()
+                for diff in diffs: self.accept(diff)
+                if stats: self.stats.merge(stats)
+                self.sampled_bytes += sampled[0]
+                self.sampled_total += sampled[1]
+                # The pairs that will be popped first are submitted first #
+                items = [[pair[0], pair[1], None] for pair in leftover]
+                for item in reversed(items):
+                    item[2] = pool.submit(run_shard, [item[:2]], self.shard_time)
+                stack.extend(items)
+                while self.ready: yield self.ready.popleft()
+        finally:
+            pool.shutdown(wait=True, cancel_futures=True)
+
+    # Seconds a worker process spends on a task before handing the rest back #
+    shard_time = 0.5
+
+    def compare_shard(self, pairs, seconds):
+        """Called in a worker process on directory pairs. Returns the
+        differences found, the pairs left for later and the sampling
+        counters and statistics."""
+        self.shard, self.leftover = pairs, []
+        self.deadline = time.time() + seconds
+        diffs = list(self.differences())
+        stats = self.stats.to_dict(reset=True) if self.stats else None
+        return diffs, self.leftover, (self.sampled_bytes, self.sampled_total), stats
+
+    def resume(self):
+        """Hand out the differences found by the interrupted run and get
+        back the one-sided entries it kept for move detection."""
+        for diff in self.state.differences():
+            self.count += 1
+            if diff.is_error: self.errors += 1
+            yield diff
+        for path, side, directory in self.state.moves():
+            if directory:
+                self.moved_dirs.append((path, side))
+                continue
+            entry = self.entry_at(path, side)
+            if entry is not None: self.moves.add(entry, side)
+
+    def entry_at(self, path, side):
+        """An entry for a file path, taken from the manifest if that side
+        is one, since the file might not be reachable."""
+        name = os.path.basename(path)
+        manifest = self.first_manifest if side == 0 else self.secnd_manifest
+        if manifest is None: return SpilledEntry(name, path)
+        contents = manifest.flat_contents(os.path.dirname(path))
+        return None if contents is None else contents[0].get(name)
+
+    def signature(self):
+        """The options that must not change when a comparison is resumed."""
+        return {'first_dir':        str(self.first_dir),
+                'secnd_dir':        str(self.secnd_dir),
+                'cmp_fn':           self.cmp_name,
+                'skip_dsstore':     self.skip_dsstore,
+                'skip_dates':       self.skip_dates,
+                'ignore':           self.ignore,
+                'detect_moves':     self.detect_moves,
+                'rename_threshold': self.rename_threshold,
+                'samples':          self.samples,
+                'seed':             self.seed}
+
+    def plan(self, pairs):
+        """Turn directory pairs into items of the stack: both paths, the
+        futures of their contents if already started, and their record
+        from the baseline if they can be trusted."""
+        items = []
+        for pair in pairs:
+            root1, root2 = pair[0], pair[1]
+            futures = list(pair[2:4]) or [None, None]
+            known = None
+            if self.baseline and futures[0] is None: known = self.known(root1, root2)
+            items.append([root1, root2] + futures + [known])
+        return items
+
+    def known(self, root1, root2):
+        """
+        The record of a directory pair from the baseline if nothing in it
+        can have changed since, otherwise `None`. Without a change feed,
+        the dates of both directories must be unchanged. Note that
+        rewriting a file in place doesn't change the dates of its
+        directory. With a change feed, pairs that have nothing in the feed
+        beneath them are trusted without looking at the disk at all.
+        """
+        record = self.baseline.get(root1)
+        if record is None or record[0] != root2: return None
+        if self.changes:
+            real1, real2 = self.real_path(root1, 0), self.real_path(root2, 1)
+            if real1 in self.changes.dirty or real2 in self.changes.dirty: return None
+            if real1 not in self.changes.hot and real2 not in self.changes.hot: return record
+        try: signature = self.baseline.signature(root1, root2)
+        except OSError: return None
+        if signature != record[1]: return None
+        return record
+
+    def real_path(self, path, side):
+        """A path of one side with its top directory resolved like the
+        paths of the change feed. Symbolic links to directories are
+        never descended into, so the rest of the path is already real."""
+        top, real = self.real_tops[side]
+        return real + path[len(top):]
+
+    def replay(self, root1, root2, record):
+        """A trusted directory pair: output its differences from the
+        previous run again, and return its subdirectory pairs."""
+        if self.scanning: self.print_current_dir(root1)
+        for diff in self.baseline.differences(root1): self.report(*diff)
+        self.baseline.put(root1, root2, record[1], record[2])
+        self.baseline.trusted += 1
+        return record[2]
+
+    def remember(self, root1, root2, subdirs):
+        """Record a directory pair that was just compared in the baseline.
+        The dates are taken after the listing, so that a change made in
+        the meantime is caught on the next run."""
+        try: signature = self.baseline.signature(root1, root2)
+        except OSError: signature = ''
+        self.baseline.put(root1, root2, signature, subdirs)
+        self.baseline.checked += 1
+
+    def prefetch(self, stack):
+        """Start listing the directory pairs that will be popped next."""
+        for item in stack[-self.listers:]:
+            if item[2] is not None or item[4] is not None: continue
+            item[2] = self.list_pool.submit(self.first_list, item[0])
+            item[3] = self.list_pool.submit(self.secnd_list, item[1])
+
+    def compare_listings(self, root1, root2, contents1, contents2):
+        """
+        Just one directory pair, given the contents of both sides.
+        Returns the list of subdirectory pairs that must be compared next,
+        each followed by the futures of their contents if already started.
+        """
         # print "Scanning" #
-        if self.verbose: self.print_current_dir(root1)
-        # Get contents #
-        contents1 = self.flat_contents(root1)
-        contents2 = self.flat_contents(root2)
+        if self.scanning: self.print_current_dir(root1)
         # Check #
         if contents1 is None:
-            self.output(os.path.basename(root1), root1, 'd', "Error: cannot access")
-            return
+            self.report(os.path.basename(root1), root1, 'd', "Error: cannot access")
+            return []
         if contents2 is None:
-            self.output(os.path.basename(root2), root2, 'd', "Error: cannot access")
-            return
+            self.report(os.path.basename(root2), root2, 'd', "Error: cannot access")
+            return []
         # Split files and directories #
         files1, dirs1 = contents1
         files2, dirs2 = contents2
         # Filter the stupid .DS_Store files #
         if self.skip_dsstore:
-            files1.discard(".DS_Store")
-            files2.discard(".DS_Store")
+            files1.pop(".DS_Store", None)
+            files2.pop(".DS_Store", None)
         # Filter the user defined ignores #
         if self.ignore:
             for item in self.ignore:
-                dirs1.discard(item)
-                dirs2.discard(item)
-        # Files missing #
-        missing = list(files1.symmetric_difference(files2))
-        missing.sort(key=natural_sort)
-        for f in missing:
-            if f in files1: self.output(f, root1+'/'+f, 'f', "Only in first")
-            else:           self.output(f, root2+'/'+f, 'f', "Only in secnd")
+                dirs1.pop(item, None)
+                dirs2.pop(item, None)
+        # Files missing (one sweep through both sorted listings) #
+        existing_files = []
+        for f, in1, in2 in merge_listings(files1, files2):
+            if in1 and in2: existing_files.append(f)
+            else:           self.one_sided_file(f, files1.get(f), files2.get(f))
+        # Directories renamed #
+        renamed = {}
+        if self.rename_threshold is not None:
+            renamed = self.find_renamed_dirs(dirs1, dirs2)
+        renamed_secnd = set(item[0] for item in renamed.values())
         # Directories missing #
-        missing = list(dirs1.symmetric_difference(dirs2))
-        missing.sort(key=natural_sort)
-        for d in missing:
-            if d in dirs1:  self.output(d, root1+'/'+d, 'd', "Only in first")
-            else:           self.output(d, root2+'/'+d, 'd', "Only in secnd")
+        existing_dirs = []
+        for d, in1, in2 in merge_listings(dirs1, dirs2):
+            if in1 and in2: existing_dirs.append(d)
+            else:           self.one_sided_dir(d, dirs1.get(d), dirs2.get(d), root2, renamed, renamed_secnd)
         # Files existing #
-        existing = list(files1.intersection(files2))
-        existing.sort(key=natural_sort)
-        for f in existing:
-            # Two files #
-            first = root1 + '/' + f
-            secnd = root2 + '/' + f
+        for f in existing_files: self.common_file(f, files1[f], files2[f])
+        # Directories existing #
+        subdirs = []
+        for d in existing_dirs:
+            subdir = self.common_dir(d, dirs1[d], dirs2[d])
+            if subdir: subdirs.append(subdir)
+        # Renamed directories are compared too #
+        for d in sorted(renamed, key=name_key):
+            d2, listing1, listing2 = renamed[d]
+            subdirs.append((root1+'/'+d, root2+'/'+d2, listing1, listing2))
+        return subdirs
+
+    def compare_spilled(self, root1, root2, contents1, contents2):
+        """
+        Same as `compare_listings` but for a directory pair of which at
+        least one side had too many entries and was spilled to disk. Both
+        sides are read back as sorted streams and merged once for every
+        step, so that only a few entries are in memory at any time. This is
+        a generator that hands out the differences as they come, and
+        returns the list of subdirectory pairs.
+        """
+        try:
+            # print "Scanning" #
+            if self.scanning: self.print_current_dir(root1)
+            # Check #
+            if contents1 is None:
+                self.report(os.path.basename(root1), root1, 'd', "Error: cannot access")
+                return []
+            if contents2 is None:
+                self.report(os.path.basename(root2), root2, 'd', "Error: cannot access")
+                return []
+            # Both streams of files and of directories, filtered #
+            def files():
+                for f, entry1, entry2 in merge_entries(entries(contents1, 'f'), entries(contents2, 'f')):
+                    if self.skip_dsstore and f == ".DS_Store": continue
+                    yield f, entry1, entry2
+            def dirs():
+                for d, entry1, entry2 in merge_entries(entries(contents1, 'd'), entries(contents2, 'd')):
+                    if self.ignore and d in self.ignore: continue
+                    yield d, entry1, entry2
+            # Files missing #
+            for f, entry1, entry2 in files():
+                if entry1 is None or entry2 is None: self.one_sided_file(f, entry1, entry2)
+                yield from self.drain()
+            # Directories renamed (only the one-sided ones are kept) #
+            renamed = {}
+            if self.rename_threshold is not None:
+                only1 = dict((d, entry1) for d, entry1, entry2 in dirs() if entry2 is None)
+                only2 = dict((d, entry2) for d, entry1, entry2 in dirs() if entry1 is None)
+                renamed = self.find_renamed_dirs(only1, only2)
+            renamed_secnd = set(item[0] for item in renamed.values())
+            # Directories missing #
+            for d, entry1, entry2 in dirs():
+                if entry1 is None or entry2 is None:
+                    self.one_sided_dir(d, entry1, entry2, root2, renamed, renamed_secnd)
+                yield from self.drain()
+            # Files existing #
+            for f, entry1, entry2 in files():
+                if entry1 is not None and entry2 is not None: self.common_file(f, entry1, entry2)
+                yield from self.drain()
+            # Directories existing #
+            subdirs = []
+            for d, entry1, entry2 in dirs():
+                if entry1 is None or entry2 is None: continue
+                subdir = self.common_dir(d, entry1, entry2)
+                if subdir: subdirs.append(subdir)
+            # Renamed directories are compared too #
+            for d in sorted(renamed, key=name_key):
+                d2, listing1, listing2 = renamed[d]
+                subdirs.append((root1+'/'+d, root2+'/'+d2, listing1, listing2))
+            return subdirs
+        finally:
+            for contents in (contents1, contents2):
+                if isinstance(contents, SpilledListing): contents.close()
+
+    def drain(self):
+        """Hand out the differences that are ready in the middle of a
+        directory. Never lets the queue of differences waiting behind
+        content checks grow beyond `max_entries`."""
+        if len(self.pending) > self.max_entries: self.flush(block=True)
+        while self.ready: yield self.ready.popleft()
+
+    #-------------------------------------------------------------------------#
+    def one_sided_file(self, f, entry1, entry2):
+        """A file that is only in one of the two directories."""
+        if entry1 is not None: self.report(f, entry1.path, 'f', "Only in first")
+        else:                  self.report(f, entry2.path, 'f', "Only in secnd")
+        if self.moves:
+            entry, side = (entry1, 0) if entry1 is not None else (entry2, 1)
+            self.moves.add(entry, side)
+            if self.state: self.state.record_move(entry.path, side)
+
+    def one_sided_dir(self, d, entry1, entry2, root2, renamed, renamed_secnd):
+        """A directory that is only in one of the two directories,
+        unless it was found to be renamed."""
+        if d in renamed and entry1 is not None:
+            self.report(d, entry1.path, 'd', "Renamed directory", other=root2+'/'+renamed[d][0])
+            return
+        if d in renamed_secnd and entry2 is not None: return
+        if entry1 is not None: self.report(d, entry1.path, 'd', "Only in first")
+        else:                  self.report(d, entry2.path, 'd', "Only in secnd")
+        if self.moves:
+            entry, side = (entry1, 0) if entry1 is not None else (entry2, 1)
+            if entry.is_symlink(): return
+            self.moved_dirs.append((entry.path, side))
+            if self.state: self.state.record_move(entry.path, side, directory=True)
+
+    def common_file(self, f, entry1, entry2):
+        """A file that is in both directories. The contents are checked
+        in the background if the sizes are equal but the dates are not."""
+        first, secnd = entry1.path, entry2.path
+        with self.measure('stat'):
             # Possible permission denied (first) #
-            try: stat1 = os.lstat(first)
+            try: stat1 = entry1.stat(follow_symlinks=False)
             except OSError:
-                self.output(f, first, 'f', "Error: cannot stat")
-                continue
+                self.report(f, first, 'f', "Error: cannot stat")
+                return
             # Possible permission denied (second) #
-            try: stat2 = os.lstat(secnd)
+            try: stat2 = entry2.stat(follow_symlinks=False)
             except OSError:
-                self.output(f, secnd, 'f', "Error: cannot stat")
-                continue
-            # Size #
-            if stat1.st_size != stat2.st_size:
-                self.output(f, first, 'f', 'Diverge in size')
-                continue
-            # Modification and creation time #
-            if (stat1.st_mtime != stat2.st_mtime) or (stat1.st_ctime != stat2.st_ctime):
-                # Special symlink case #
-                if os.path.islink(first):
-                    if os.readlink(first) != os.readlink(secnd):
-                        self.output(f, first, 's', 'Symbolic file divergence')
-                        continue
-                # Checksum #
-                else:
-                    if self.debug:
-                        message = "***\nFile %i: %s\n Modtime: %s\n Creatime: %s\n Size: %s"
-                        print(message % (1, first, stat1.st_mtime, stat1.st_ctime, stat1.st_size))
-                        print(message % (2, secnd, stat2.st_mtime, stat2.st_ctime, stat2.st_size))
-                    try:
-                        sum1, sum2 = map(self.cmp_fn, (first, secnd))
-                    except IOError:
-                        self.output(f, first, 'f', 'Error: cannot read')
-                        continue
-                    if sum1 != sum2:
-                        self.output(f, first, 'f', 'Diverge in contents')
-                        continue
-                if not self.skip_dates: self.output(f, first, 'f', 'Diverge only in date')
-        # Directories existing #
-        existing = list(dirs1.intersection(dirs2))
-        existing.sort(key=natural_sort)
-        for d in existing:
-            first = root1 + '/' + d
-            secnd = root2 + '/' + d
+                self.report(f, secnd, 'f', "Error: cannot stat")
+                return
+        # Size #
+        if stat1.st_size != stat2.st_size:
+            self.report(f, first, 'f', 'Diverge in size', stat1, stat2)
+            return
+        # Modification and creation time #
+        if (stat1.st_mtime_ns != stat2.st_mtime_ns) or (stat1.st_ctime_ns != stat2.st_ctime_ns):
             # Special symlink case #
-            if os.path.islink(first):
-                if os.readlink(first) != os.readlink(secnd):
-                    self.output(d, first, 's', 'Symbolic dir divergence')
-                continue
-            # Normal case (recursion) #
-            self.compare_two_dirs(first, secnd)
+            if entry1.is_symlink():
+                if readlink(entry1) != readlink(entry2):
+                    self.report(f, first, 's', 'Symbolic file divergence', stat1, stat2)
+                    return
+                if not self.skip_dates:
+                    self.report(f, first, 'f', 'Diverge only in date', stat1, stat2)
+                return
+            # Checksum #
+            if self.debug:
+                message = "***\nFile %i: %s\n Modtime: %s\n Creatime: %s\n Size: %s"
+                print(message % (1, first, stat1.st_mtime, stat1.st_ctime, stat1.st_size))
+                print(message % (2, secnd, stat2.st_mtime, stat2.st_ctime, stat2.st_size))
+            if self.stats: self.stats.add('content_checks')
+            if self.schedule: self.schedule_check(f, entry1, entry2)
+            else:             self.submit(self.check_contents, f, entry1, entry2)
+
+    def common_dir(self, d, entry1, entry2):
+        """A directory that is in both directories. Returns the pair
+        to descend into later, or `None` for symbolic links."""
+        first, secnd = entry1.path, entry2.path
+        # Special symlink case #
+        if entry1.is_symlink():
+            if readlink(entry1) != readlink(entry2):
+                self.report(d, first, 's', 'Symbolic dir divergence')
+            return None
+        # Normal case (descend later) #
+        return (first, secnd, None, None)
+
+    def find_renamed_dirs(self, dirs1, dirs2):
+        """
+        Among the directories that are only on one side, find the pairs
+        whose children are similar enough to consider them renamed.
+        Returns a dictionary of first side names to the second side name
+        and the futures of both listings, which are reused to descend.
+        """
+        only1 = [d for d in dirs1 if d not in dirs2 and not dirs1[d].is_symlink()]
+        only2 = [d for d in dirs2 if d not in dirs1 and not dirs2[d].is_symlink()]
+        if not only1 or not only2: return {}
+        # List all of them concurrently #
+        listings1 = dict((d, self.list_pool.submit(self.first_list, dirs1[d].path)) for d in only1)
+        listings2 = dict((d, self.list_pool.submit(self.secnd_list, dirs2[d].path)) for d in only2)
+        # Spilled listings are too big to be turned into tokens #
+        usable  = lambda f: isinstance(f.result(), tuple)
+        spilled = [f for f in list(listings1.values()) + list(listings2.values())
+                   if isinstance(f.result(), SpilledListing)]
+        if spilled and not self.spill_warned:
+            print("Warning: directories of more than %i entries are spilled to disk and"
+                  " are not checked for renames." % self.max_entries, file=sys.stderr)
+            self.spill_warned = True
+        tokens1 = dict((d, directory_tokens(f.result())) for d, f in listings1.items() if usable(f))
+        tokens2 = dict((d, directory_tokens(f.result())) for d, f in listings2.items() if usable(f))
+        # Match them #
+        matches = match_directories(tokens1, tokens2, self.rename_threshold)
+        return dict((d1, (d2, listings1[d1], listings2[d2])) for d1, d2, score in matches)
+
+    def check_contents(self, f, entry1, entry2, digests=None):
+        """
+        Called from one of the workers on a pair of files that have the same
+        size but different dates. Returns the list of differences found.
+        The `digests` of both files are given if they were already read,
+        or the error that happened while reading them.
+        """
+        first = entry1.path
+        stats = (entry1.stat(follow_symlinks=False), entry2.stat(follow_symlinks=False))
+        try:
+            if digests is None: same = self.same_contents(entry1, entry2)
+            else:
+                for digest in digests:
+                    if isinstance(digest, IOError): raise digest
+                same = digests[0] == digests[1]
+        except IOError:
+            return [(f, first, 'f', 'Error: cannot read') + stats]
+        if not same:
+            return [(f, first, 'f', 'Diverge in contents') + stats]
+        if not self.skip_dates:
+            return [(f, first, 'f', 'Diverge only in date') + stats]
+        return []
+
+    def check_batch(self, batch):
+        """
+        Called from one of the workers on the content checks collected by
+        `schedule_check`. Instead of reading both files of every pair in
+        turn, which makes the heads of spinning disks jump back and forth,
+        the files of each device are read in the order of their place on
+        the disk, and the devices are read in parallel. The digests are
+        then compared pair by pair. Pairwise comparison functions need both
+        files at once, so the pairs are only sorted by their first file.
+        """
+        try:
+            if self.pairwise:
+                for future, f, entry1, entry2 in sorted(batch, key=lambda item: disk_order(item[2])):
+                    future.set_result(self.check_contents(f, entry1, entry2))
+                return
+            # All the files to read, grouped by device #
+            devices = {}
+            for future, f, entry1, entry2 in batch:
+                for side, entry in (('first', entry1), ('secnd', entry2)):
+                    key = disk_order(entry)
+                    devices.setdefault(key[0], []).append((key, side, entry))
+            # Every device is read in its own thread #
+            digests = {}
+            def read(files):
+                for key, side, entry in sorted(files, key=lambda item: item[0]):
+                    try:               digests[side, entry.path] = self.digest(entry, side)
+                    except IOError as error: digests[side, entry.path] = error
+            groups = list(devices.values())
+            others = [self.side_pool.submit(read, files) for files in groups[1:]]
+            read(groups[0])
+            for other in others: other.result()
+            # Compare every pair #
+            for future, f, entry1, entry2 in batch:
+                pair = (digests['first', entry1.path], digests['secnd', entry2.path])
+                future.set_result(self.check_contents(f, entry1, entry2, pair))
+        # Never leave a check unfinished, the output waits for it #
+        except BaseException as error:
+            for item in batch:
+                if not item[0].done(): item[0].set_exception(error)
+
+    def find_moves(self):
+        """
+        Called once both trees have been compared. Looks for files that
+        were reported as only in one directory and as only in the other,
+        but that have the same contents, and yields them as moved.
+        """
+        # Files inside one-sided directories can have moved too #
+        for path, side in self.moved_dirs:
+            lister = self.first_list if side == 0 else self.secnd_list
+            for entry in walk_files(lister, path): self.moves.add(entry, side)
+        # Report every pair #
+        for entry1, entry2 in self.moves.pairs():
+            stats = (entry1.stat(follow_symlinks=False), entry2.stat(follow_symlinks=False))
+            self.output(entry1.name, entry1.path, 'f', 'Moved/renamed', *stats, other=entry2.path)
+        while self.ready: yield self.ready.popleft()
+
+    def move_digest(self, entry):
+        """The full digest used to confirm that a file was moved. When the
+        comparison function doesn't give a digest, we use md5."""
+        if not self.pairwise and self.cmp_name != 'sizes_only': return self.digest(entry)
+        if isinstance(entry, ManifestEntry): return entry.digest_for('md5')
+        return file_digest(entry.path, 'md5', reader=self.reader)
+
+    def move_fingerprint(self, path, size):
+        """The partial fingerprint that rules out most candidate moves,
+        read like every other file so that the limits still apply."""
+        return partial_fingerprint(path, size, reader=self.reader)
+
+    #-------------------------------------------------------------------------#
+    def same_contents(self, entry1, entry2):
+        """Are the contents of these two files identical according to
+        the comparison function that was picked?"""
+        if self.pairwise:
+            with self.measure('compare_pair'): same = self.cmp_fn(entry1.path, entry2.path, reader=self.reader)
+            if self.cmp_name == 'sample': self.record_sampling(entry1)
+            elif self.stats:
+                size = entry1.stat(follow_symlinks=False).st_size
+                self.stats.add('bytes_first', size)
+                self.stats.add('bytes_secnd', size)
+            return same
+        # Both files are processed in parallel #
+        sum2 = self.side_pool.submit(self.digest, entry2, 'secnd')
+        sum1 = self.digest(entry1, 'first')
+        with self.measure('wait_secnd'): sum2 = sum2.result()
+        return sum1 == sum2
+
+    def record_sampling(self, entry):
+        """Keep track of the proportion of bytes that sampling read."""
+        size = entry.stat(follow_symlinks=False).st_size
+        covered = sample_coverage(size, self.samples, seed=self.seed)
+        with self.sampled_lock:
+            self.sampled_bytes += covered
+            self.sampled_total += size
+        if self.stats:
+            self.stats.add('bytes_first', covered)
+            self.stats.add('bytes_secnd', covered)
+
+    def digest(self, entry, side='moves'):
+        """Apply the comparison function to one file, unless the
+        manifest or the cache already knows the answer. The `side` is
+        only used to name the statistics."""
+        if isinstance(entry, ManifestEntry): return entry.digest_for(self.cmp_name)
+        if not getattr(self, 'cache', None): return self.hash_file(entry, side)
+        stat = entry.stat(follow_symlinks=False)
+        result = self.cache.get(stat, self.cmp_name)
+        if result is None:
+            result = self.hash_file(entry, side)
+            self.cache.put(stat, self.cmp_name, result)
+        return result
+
+    def hash_file(self, entry, side):
+        """Read one file through the comparison function, counting
+        the time and the bytes if statistics were asked for."""
+        if self.stats is None: return self.cmp_fn(entry.path, reader=self.reader)
+        with self.stats.timer('hash_' + side): result = self.cmp_fn(entry.path, reader=self.reader)
+        self.stats.add('bytes_' + side, entry.stat(follow_symlinks=False).st_size)
+        return result
+
+    def limited_list(self, limit, lister, root):
+        """List a directory with `lister` once the tree allows one more
+        operation at the same time."""
+        with limit.slot(): return lister(root)
+
+    def timed_list(self, lister, side, root):
+        """List a directory with `lister`, counting the time and the
+        entries. Only used when statistics were asked for."""
+        with self.stats.timer('list_' + side): contents = lister(root)
+        if isinstance(contents, tuple): self.stats.add('entries_' + side, len(contents[0]) + len(contents[1]))
+        elif contents is not None:      self.stats.add('entries_' + side, contents.count)
+        return contents
+
+    def measure(self, name):
+        """Time a block of code if statistics were asked for."""
+        if self.stats is None: return no_timer
+        return self.stats.timer(name)
 
     #-------------------------------------------------------------------------#
+    def submit(self, fn, *args):
+        """
+        Queue a content check on the worker pool. Its differences will be
+        output in the order in which the check was submitted. We never let
+        more than a few checks per worker pile up while the walk continues,
+        on top of the batch being collected when scheduling.
+        """
+        self.queue(self.pool.submit(fn, *args))
+
+    def schedule_check(self, f, entry1, entry2):
+        """Add a content check to the batch, which is handed to the worker
+        pool once it holds `schedule` checks, or when waiting for all
+        the checks. Its differences still keep their place in the output."""
+        from concurrent.futures import Future
+        future = Future()
+        self.batch.append((future, f, entry1, entry2))
+        if len(self.batch) >= self.schedule: self.dispatch()
+        self.queue(future)
+
+    def dispatch(self):
+        """Hand the batch of content checks to the worker pool."""
+        batch, self.batch = self.batch, []
+        self.pool.submit(self.check_batch, batch)
+
+    def queue(self, future):
+        """Put the future result of a content check in the queue of
+        differences, waiting for older ones if too many are pending."""
+        self.pending.append((self.current, future))
+        self.in_flight += 1
+        while self.in_flight > 4 * self.jobs + (self.schedule or 0):
+            oldest = next(item for owner, item in self.pending if not isinstance(item, tuple))
+            with self.measure('wait_checks'): oldest.result()
+            self.flush()
+        self.flush()
+
+    def report(self, name, path, kind, status, stat1=None, stat2=None, other=None):
+        """Output a difference now, unless there are content checks
+        submitted before it that are still running."""
+        diff = (name, path, kind, status, stat1, stat2, other)
+        if self.pending: self.pending.append((self.current, diff))
+        else:            self.emit(self.current, diff)
+
+    def flush(self, block=False):
+        """Output all the queued differences whose turn has come.
+        If `block` is set, wait for every content check to finish.
+        Every item in the queue also has the directory pair it was found in."""
+        if block and self.batch: self.dispatch()
+        while self.pending:
+            owner, item = self.pending[0]
+            if not isinstance(item, tuple):
+                if not item.done():
+                    if not block: break
+                    with self.measure('wait_checks'): item.exception()
+                diffs = item.result()
+                self.in_flight -= 1
+            else:
+                diffs = [item]
+            self.pending.popleft()
+            for diff in diffs: self.emit(owner, diff)
+
+    def emit(self, owner, diff):
+        """Output a difference and remember in which directory pair
+        (given by its first path) it was found."""
+        self.output(*diff)
+        if self.baseline: self.baseline.record(owner, self.ready[-1])
+
     def flat_contents(self, root):
-        for root, dirs, files in os.walk(root):
-            return set(f for f in files), set(d for d in dirs)
+        """
+        List a directory with a single `os.scandir` call. Returns two
+        dictionaries of names to `os.DirEntry` objects, one for files and one
+        for directories, or `None` if the directory can't be read.
+        The entries carry their type and cache their stat result.
+        Like `os.walk`, symbolic links to directories count as directories.
+        With `max_entries`, a directory that has more entries than that is
+        written to disk in sorted batches and a `SpilledListing` is returned.
+        """
+        files, dirs, spilled = {}, {}, None
+        try:
+            with os.scandir(root) as scan:
+                for entry in scan:
+                    try:                is_dir = entry.is_dir()
+                    except OSError:     is_dir = False
+                    if is_dir: dirs[entry.name]  = entry
+                    else:      files[entry.name] = entry
+                    if self.max_entries and len(files) + len(dirs) > self.max_entries:
+                        if spilled is None: spilled = SpilledListing(root, self.spill_dir)
+                        spilled.spill(files, dirs)
+        except OSError:
+            if spilled is not None: spilled.close()
+            return None
+        if spilled is None: return files, dirs
+        spilled.spill(files, dirs)
+        return spilled
 
     status_to_color = {
         'first'   : Color.f_cyn,
@@ -218,13 +1173,31 @@ class Analysis(object):
         'size'    : Color.f_ylw,
         'date'    : Color.f_wht,
         'Symbolic': Color.f_ylw,
+        'Moved'   : Color.f_blu,
+        'Renamed' : Color.f_blu,
         'Error'   : Color.ylw + Color.flash + Color.f_red
     }
 
-    def output(self, name, path, kind, status):
+    def output(self, name, path, kind, status, stat1=None, stat2=None, other=None):
+        """
+        Every difference is recorded by calling this method from
+        `self.compare_two_dirs()`. It is then handed out by
+        `self.differences()`.
         """
-        Every difference is either displayed or recorded by calling
-        this method from `self.compare_two_dirs()`.
+        with self.measure('output'):
+            self.accept(Difference(name, path, kind, status, stat1, stat2, other))
+
+    def accept(self, diff):
+        """Count a difference and queue it to be handed out."""
+        self.count += 1
+        if diff.is_error: self.errors += 1
+        if self.state: self.state.record(diff)
+        self.ready.append(diff)
+
+    def display(self, diff):
+        """
+        Every difference is displayed by calling this method from
+        `self.run()`.
 
         One has to be careful with file and directory paths, they are
         essentially uncontrolled user input. Don't use str.format() because
@@ -233,9 +1206,13 @@ class Analysis(object):
         A path can even contain the character `\r` erasing the line you
         just printed, so sanitize everything.
         """
-        # Record #
-        self.count += 1
-        if 'Error' in status: self.errors += 1
+        kind, path, status = diff.kind, diff.path, diff.status
+        # Machine readable formats skip all the terminal formatting #
+        if self.format != 'text':
+            self.writer.write(diff)
+            return
+        # Moved files show both paths #
+        if diff.other is not None: path = path + ' -> ' + diff.other
         # Give color to different messages #
         for keyword in self.status_to_color:
             if keyword in status:
@@ -243,7 +1220,7 @@ class Analysis(object):
                 break
         else: color = Color.f_grn
         # Sanitize input #
-        path = sanitize_text(path)
+        with self.measure('sanitize'): path = sanitize_text(path)
         # Build string to print(#
         string = u'(%s) ' % kind
         string = string + path
@@ -252,7 +1229,7 @@ class Analysis(object):
         # Check #
         assert len(string) > self.columns
         # Remove the scanning line first #
-        if self.verbose:
+        if self.scanning:
             sys.stdout.write('\r')
             sys.stdout.flush()
         # print(#
@@ -262,9 +1239,32 @@ class Analysis(object):
         """
         If verbosity is turned on, display the current directory
         that is being scanned, and then print('\r' to show the next.
+        The line is refreshed at most once every `self.refresh` seconds.
         """
+        # Don't write to the terminal for every directory #
+        now = time.time()
+        if now - self.last_refresh < self.refresh: return
+        self.last_refresh = now
         # Verbose (can't have line longer than terminal size) #
         string = '{:%i.%i}' % (self.columns-10, self.columns-10)
         string = string.format(directory + '/')
         sys.stdout.write('\r' + Color.bold + 'Scanning: ' + Color.end + string)
         sys.stdout.flush()
+
+################################################################################
+# Used instead of a timer when statistics are off, it does nothing #
+no_timer = nullcontext()
+
+# With `processes`, every worker process builds its own copy of the analysis #
+worker = None
+
+def start_worker(arguments):
+    global worker
+    arguments = dict(arguments, processes=1, verbose=False, format='text')
+    worker = Analysis(**arguments)
+    # The whole worker process is ours, its main thread lists directories too #
+    if worker.ionice is not None:
+        from pydirdiff.throttle import set_ionice
+        set_ionice(worker.ionice)
+
+def run_shard(pairs, seconds): return worker.compare_shard(pairs, seconds)
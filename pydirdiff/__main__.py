@@ -5,6 +5,11 @@ An example from the command line is the following:
 
     $ ipython3 -i -m pydirdiff -- /Volumes/FirstCopy/Files/Music /Volumes/SecondCopy/Files/Music
        --ignore='.git' --ignore='-Dump-' --cmp_fn='sizes_only'
+
+To save a manifest of a directory and compare against it later:
+
+    $ python3 -m pydirdiff snapshot /Volumes/SecondCopy/Files/Music -o music.manifest --cmp_fn='md5'
+    $ python3 -m pydirdiff /Volumes/FirstCopy/Files/Music music.manifest
 """
 
 # Built-in modules #
@@ -19,23 +24,126 @@ if __name__ == '__main__':
     import pydirdiff
     from pydirdiff.plumbing.common import flatter
 
+    # The snapshot command has its own arguments #
+    if sys.argv[1:2] == ['snapshot']:
+        parser = argparse.ArgumentParser(prog="pydirdiff snapshot",
+                                         description="Write the manifest of a directory.")
+        parser.add_argument("directory", help="The directory to scan", type=str)
+        parser.add_argument("-o", "--output", help="Where to write the manifest", required=True)
+        parser.add_argument("--cmp_fn", help="Also record the digest of every file with this"
+                                             " comparison function, for instance `md5`."
+                                             " Defaults to `None`.")
+        args = parser.parse_args(sys.argv[2:])
+        # Only functions that give one digest per file can be recorded #
+        if args.cmp_fn and args.cmp_fn not in pydirdiff.comparison_fns:
+            parser.error("'%s' can't be recorded in a manifest, choose one of: %s." %
+                         (args.cmp_fn, ', '.join(sorted(pydirdiff.comparison_fns))))
+        if args.cmp_fn in pydirdiff.hash_modules and not pydirdiff.hash_available(args.cmp_fn):
+            parser.error("The '%s' comparison function needs the '%s' package." %
+                         (args.cmp_fn, pydirdiff.hash_modules[args.cmp_fn]))
+        cmp_fn = pydirdiff.comparison_fns[args.cmp_fn] if args.cmp_fn else None
+        count = pydirdiff.Manifest.write(args.directory, args.output, cmp_fn, args.cmp_fn)
+        print("Wrote %i directories to '%s'." % (count, args.output))
+        sys.exit(0)
+
     # Make a shell arguments parser #
     desc = pydirdiff.version_string
     parser = argparse.ArgumentParser(description=desc, formatter_class=RawTextHelpFormatter)
 
     # All the required arguments #
-    parser.add_argument("first_dir", help="The first directory to process", type=str)
-    parser.add_argument("secnd_dir", help="The second directory to process", type=str)
+    parser.add_argument("first_dir", help="The first directory (or manifest) to process", type=str)
+    parser.add_argument("secnd_dir", help="The second directory (or manifest) to process", type=str)
 
     # All the optional arguments #
     parameters = {
-        "cmp_fn"        : "Either `md5` or `sizes_only`. Defaults to `md5`.",
+        "cmp_fn"        : "Either a hash algorithm (`md5`, `sha1`, `sha256`,"
+                          " `blake2b`, or `xxh3` and `blake3` if installed),"
+                          " `bytes`, `sample` or `sizes_only`. Defaults to `md5`.",
+        "blocksize"     : "Number of bytes read at a time when hashing or"
+                          " comparing files. Defaults to `65536` for hashes"
+                          " and `1048576` for `bytes`.",
+        "samples"       : "With `sample`, the number of pseudo-random 1 MiB blocks"
+                          " read in each file, on top of the first and the last."
+                          " Defaults to `16`.",
+        "seed"          : "With `sample`, the seed that picks the offsets of the"
+                          " blocks. Defaults to `0`.",
         "skip_dsstore"  : "Ignore all '.DS_Store' files. Either `True`"
                           " or `False`. Defaults to `True`.",
         "skip_dates"    : "Don't print files that just differ in dates."
                           " Either `True` or `False`. Defaults to `True`.",
         "verbose"       : "Display current directory as search progresses."
-                          " Either `True` or `False`. Defaults to `True`.",
+                          " Either `True` or `False`. Defaults to `True`."
+                          " Always off when stdout is not a terminal.",
+        "refresh"       : "Minimum number of seconds between two updates of"
+                          " the current directory display. Defaults to `0.2`.",
+        "jobs"          : "Number of file pairs to check the contents of"
+                          " concurrently. Defaults to `1`.",
+        "readahead"     : "Number of blocks of every file requested ahead of the one"
+                          " being compared, by a pool of threads shared by all the"
+                          " files. Up to `2 * jobs * readahead` reads are then in"
+                          " flight, which is what high latency mounts (network,"
+                          " object storage) need. Defaults to `None` (no read-ahead).",
+        "schedule"      : "Collect this many content checks and read their files"
+                          " device by device, in the order of their place on the"
+                          " disk (FIEMAP on Linux, otherwise inode numbers), instead"
+                          " of in name order alternating between both sides. Meant"
+                          " for spinning disks. Defaults to `None`.",
+        "concurrency"   : "Maximum number of listings and file reads at the same time"
+                          " in each tree. Either one number for both or `first,secnd`,"
+                          " where `0` is no limit. Defaults to `None`.",
+        "bandwidth"     : "Maximum number of MB/s read from the files of each tree."
+                          " Either one number for both or `first,secnd`, where `0`"
+                          " is no limit. Defaults to `None`.",
+        "ionice"        : "I/O priority of the threads reading the trees on Linux,"
+                          " like the `ionice` command: `idle`, or `best-effort:0`"
+                          " (highest) to `best-effort:7` (lowest). Defaults to `None`.",
+        "mmap"          : "Read files of 4 MiB or more through a memory map, which"
+                          " saves a copy on local disks. Only for trees that nobody"
+                          " modifies during the comparison: a file truncated while"
+                          " it is read kills the process. Either `True` or `False`."
+                          " Defaults to `False`.",
+        "listers"       : "Number of directories listed concurrently, ahead"
+                          " of the comparison. Defaults to `2`.",
+        "processes"     : "Number of processes the comparison is split between,"
+                          " to use several cores. Defaults to `1`.",
+        "format"        : "Either `text`, `jsonl`, `csv` or `null0`. The last three"
+                          " write one record per difference to stdout with no"
+                          " terminal formatting, and messages to stderr."
+                          " Defaults to `text`.",
+        "detect_moves"  : "After the comparison, find files that are only in one"
+                          " directory and only in the other but with the same"
+                          " contents, and report them as moved or renamed."
+                          " Either `True` or `False`. Defaults to `False`.",
+        "rename_threshold": "Directories only in one side and only in the other"
+                          " whose children are at least this similar (Jaccard"
+                          " index of names and sizes, between 0 and 1) are"
+                          " considered renamed and compared. Defaults to `None`.",
+        "cache"         : "Path to a file where checksums are remembered"
+                          " between runs. Must be outside both directories."
+                          " Defaults to `None`.",
+        "max_entries"   : "Directories with more entries than this are written"
+                          " to disk in sorted batches and merged back, so that"
+                          " memory stays bounded. Defaults to `None`.",
+        "spill_dir"     : "Where the batches of `max_entries` are written. Must be"
+                          " outside both directories. Defaults to the temporary"
+                          " directory.",
+        "resume"        : "Path to a state file where the progress is saved every"
+                          " minute. If it exists, the comparison continues from"
+                          " where it was interrupted. It is removed once the"
+                          " comparison is finished. Defaults to `None`.",
+        "baseline"      : "Path to a file where the outcome of every directory pair"
+                          " is remembered. On the next run, pairs where neither"
+                          " directory changed dates are not listed again and their"
+                          " differences are taken from it. Defaults to `None`.",
+        "changes"       : "With `baseline`, a file of paths that changed since, one"
+                          " per line (for instance from inotify). Only the directories"
+                          " containing them are compared again. Defaults to `None`.",
+        "stats"         : "At the end, print how long the listings, stat calls,"
+                          " hashing, queue waits and output took, with histograms,"
+                          " and how many bytes were read on each side."
+                          " Either `True` or `False`. Defaults to `False`.",
+        "stats_file"    : "Write the same statistics to this file as JSON, together"
+                          " with the total time and peak memory. Defaults to `None`.",
     }
 
     # Add parameters #
@@ -56,6 +164,10 @@ if __name__ == '__main__':
     kwargs = {k: getattr(args, k) for k in parameters
               if getattr(args, k) is not None}
 
+    # Booleans are given as strings on the command line #
+    for k, v in kwargs.items():
+        if v in ('True', 'False'): kwargs[k] = (v == 'True')
+
     # Take care of multiple ignores #
     if args.ignore: kwargs['ignore'] = flatter(args.ignore)
 
@@ -0,0 +1,166 @@
+# Built-in modules #
+import os, json, sqlite3
+
+################################################################################
+class Baseline(object):
+    """
+    The outcome of the last complete comparison for every directory pair,
+    stored in a SQLite database, so that the next comparison only looks
+    at what could have changed since.
+
+    For every directory pair we remember the stat signature of both
+    directories, the subdirectory pairs to descend into and the
+    differences that were found among its entries. The rows of the run in
+    progress are written next to the rows of the previous run, and replace
+    them only once the run completes. A run that is interrupted thus leaves
+    the previous baseline untouched.
+
+    Use it like this:
+
+        baseline = Baseline('~/original-vs-copy.baseline', options)
+        row = baseline.get('/Volumes/Original/photos')
+        if row and row[1] == baseline.signature(first, secnd): print("Unchanged")
+        baseline.close(finished=True)
+    """
+
+    schema = ["""CREATE TABLE IF NOT EXISTS meta (
+                    options TEXT    NOT NULL,
+                    run     INTEGER NOT NULL)""",
+              """CREATE TABLE IF NOT EXISTS dirs (
+                    first     BLOB    NOT NULL,
+                    secnd     BLOB    NOT NULL,
+                    signature TEXT    NOT NULL,
+                    subdirs   TEXT    NOT NULL,
+                    run       INTEGER NOT NULL,
+                    PRIMARY KEY (first, run))""",
+              """CREATE TABLE IF NOT EXISTS differences (
+                    first  BLOB NOT NULL, run INTEGER NOT NULL,
+                    name   BLOB, path   BLOB, kind   TEXT, status TEXT,
+                    size1  INTEGER, size2  INTEGER,
+                    mtime1 INTEGER, mtime2 INTEGER, other BLOB)""",
+              """CREATE INDEX IF NOT EXISTS differences_first ON differences (first, run)"""]
+
+    def __repr__(self): return '<%s object on "%s">' % (self.__class__.__name__, self.path)
+
+    def __init__(self, path, options):
+        # Base parameters #
+        self.path    = os.path.abspath(os.path.expanduser(path))
+        self.options = json.dumps(options, sort_keys=True)
+        # Create or check #
+        self.connection = sqlite3.connect(self.path)
+        for statement in self.schema: self.connection.execute(statement)
+        row = self.connection.execute("SELECT options, run FROM meta").fetchone()
+        # A baseline made with other options is useless #
+        if row is None or row[0] != self.options:
+            for table in ('meta', 'dirs', 'differences'):
+                self.connection.execute("DELETE FROM %s" % table)
+            self.connection.execute("INSERT INTO meta VALUES (?, 0)", (self.options,))
+            row = (self.options, 0)
+        self.connection.commit()
+        # The previous run and the one in progress #
+        self.previous = row[1]
+        self.current  = row[1] + 1
+        # Other #
+        self.trusted = 0
+        self.checked = 0
+
+    @staticmethod
+    def signature(first, secnd):
+        """What must not change in a directory pair to trust it: the
+        identity and the dates of both directories. Adding, removing or
+        renaming an entry updates the dates of its directory."""
+        result = []
+        for path in (first, secnd):
+            stat = os.stat(path)
+            result += [stat.st_dev, stat.st_ino, stat.st_mtime_ns, stat.st_ctime_ns]
+        return json.dumps(result)
+
+    def get(self, first):
+        """The `(secnd, signature, subdirs)` of a directory pair in the
+        previous run, or `None` if it wasn't there."""
+        query = "SELECT secnd, signature, subdirs FROM dirs WHERE first=? AND run=?"
+        row = self.connection.execute(query, (os.fsencode(first), self.previous)).fetchone()
+        if row is None: return None
+        return os.fsdecode(row[0]), row[1], json.loads(row[2])
+
+    def differences(self, first):
+        """The differences found among the entries of a directory pair in
+        the previous run, as tuples of `Analysis.report` arguments."""
+        decode = lambda blob: None if blob is None else os.fsdecode(blob)
+        stat   = lambda size, mtime: None if size is None else StoredStat(size, mtime)
+        query  = "SELECT name, path, kind, status, size1, size2, mtime1, mtime2, other" \
+                 " FROM differences WHERE first=? AND run=? ORDER BY rowid"
+        rows = self.connection.execute(query, (os.fsencode(first), self.previous)).fetchall()
+        return [(decode(name), decode(path), kind, status, stat(size1, mtime1),
+                 stat(size2, mtime2), decode(other))
+                for name, path, kind, status, size1, size2, mtime1, mtime2, other in rows]
+
+    def put(self, first, secnd, signature, subdirs):
+        """Remember a directory pair for the run in progress."""
+        subdirs = json.dumps([[pair[0], pair[1]] for pair in subdirs])
+        values  = (os.fsencode(first), os.fsencode(secnd), signature, subdirs, self.current)
+        self.connection.execute("INSERT OR REPLACE INTO dirs VALUES (?, ?, ?, ?, ?)", values)
+
+    def record(self, first, diff):
+        """Remember a difference found in a directory pair."""
+        encode = lambda text: None if text is None else os.fsencode(text)
+        values = (os.fsencode(first), self.current, encode(diff.name), encode(diff.path),
+                  diff.kind, diff.status, diff.size1, diff.size2, diff.mtime1, diff.mtime2,
+                  encode(diff.other))
+        query = "INSERT INTO differences VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"
+        self.connection.execute(query, values)
+
+    def close(self, finished=False):
+        """If the run finished, it becomes the new baseline. Otherwise
+        everything it wrote is dropped."""
+        if finished:
+            self.connection.execute("DELETE FROM dirs WHERE run < ?", (self.current,))
+            self.connection.execute("DELETE FROM differences WHERE run < ?", (self.current,))
+            self.connection.execute("UPDATE meta SET run=?", (self.current,))
+            self.connection.commit()
+        self.connection.close()
+
+################################################################################
+class StoredStat(object):
+    """The part of an `os.stat_result` that a `Difference` shows,
+    as remembered in the baseline."""
+
+    __slots__ = ('st_size', 'st_mtime_ns')
+
+    def __init__(self, size, mtime_ns):
+        self.st_size     = size
+        self.st_mtime_ns = mtime_ns
+
+################################################################################
+class ChangeFeed(object):
+    """
+    A file listing the paths that changed since the baseline, one per line,
+    for instance written by a tool watching the trees with inotify or
+    fanotify. Paths can be on either side, relative paths are taken from
+    the current directory and symbolic links are resolved, so they have
+    to be matched against resolved paths too. A directory pair has to be
+    compared again if it, or a file directly in it, is in the feed. All
+    the directories above such a pair have to be visited to reach it; the
+    others are trusted without even looking at them.
+    """
+
+    def __repr__(self): return '<%s object on "%s">' % (self.__class__.__name__, self.path)
+
+    def __init__(self, path):
+        self.path  = path
+        self.dirty = set()
+        self.hot   = set()
+        with open(os.path.expanduser(path), 'rb') as handle:
+            for line in handle:
+                changed = os.fsdecode(line.rstrip(b'\n'))
+                if not changed: continue
+                changed = os.path.realpath(changed)
+                # The path itself if it's a directory, and its parent #
+                parent = os.path.dirname(changed)
+                self.dirty.update((changed, parent))
+                # All the directories above #
+                while parent not in self.hot and parent != os.path.dirname(parent):
+                    self.hot.add(parent)
+                    parent = os.path.dirname(parent)
+                self.hot.add(parent)
+                self.hot.add(changed)
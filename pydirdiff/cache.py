@@ -0,0 +1,87 @@
+# Built-in modules #
+import os, time, sqlite3, threading
+
+################################################################################
+class ChecksumCache(object):
+    """
+    A persistent index of file digests stored in a SQLite database, so that
+    unchanged files don't have to be read again on the next run.
+
+    Entries are keyed on the device and inode of a file and are only trusted
+    if the size, modification time and change time (in nanoseconds) still
+    match. Any change to a file thus invalidates its entry. Entries that were
+    not used for `max_age` days are evicted when the cache is closed.
+
+    Use it like this:
+
+        cache = ChecksumCache('~/.cache/pydirdiff.sqlite')
+        digest = cache.get(os.lstat(path), 'md5')
+        cache.put(os.lstat(path), 'md5', file_digest(path, 'md5'))
+        cache.close()
+    """
+
+    schema = """CREATE TABLE IF NOT EXISTS digests (
+                    device   INTEGER NOT NULL,
+                    inode    INTEGER NOT NULL,
+                    algo     TEXT    NOT NULL,
+                    size     INTEGER NOT NULL,
+                    mtime_ns INTEGER NOT NULL,
+                    ctime_ns INTEGER NOT NULL,
+                    digest   BLOB    NOT NULL,
+                    used     INTEGER NOT NULL,
+                    PRIMARY KEY (device, inode, algo))"""
+
+    def __repr__(self): return '<%s object on "%s">' % (self.__class__.__name__, self.path)
+
+    def __init__(self, path, max_age=30, commit_every=1000):
+        # Base parameters #
+        self.path         = os.path.abspath(os.path.expanduser(path))
+        self.max_age      = max_age
+        self.commit_every = commit_every
+        # Workers share the same connection #
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(self.path, check_same_thread=False)
+        self.connection.execute(self.schema)
+        self.connection.commit()
+        # Other #
+        self.now     = int(time.time())
+        self.hits    = 0
+        self.misses  = 0
+        self.written = 0
+
+    def get(self, stat, algo):
+        """Return the stored digest or `None` if missing or stale."""
+        query = "SELECT size, mtime_ns, ctime_ns, digest FROM digests" \
+                " WHERE device=? AND inode=? AND algo=?"
+        with self.lock:
+            row = self.connection.execute(query, (stat.st_dev, stat.st_ino, algo)).fetchone()
+            if row is None or tuple(row[:3]) != self.signature(stat):
+                self.misses += 1
+                return None
+            self.connection.execute("UPDATE digests SET used=? WHERE device=? AND inode=? AND algo=?",
+                                    (self.now, stat.st_dev, stat.st_ino, algo))
+            self.hits += 1
+            return row[3]
+
+    def put(self, stat, algo, digest):
+        """Store a digest, replacing any stale entry for the same inode."""
+        query = "INSERT OR REPLACE INTO digests VALUES (?, ?, ?, ?, ?, ?, ?, ?)"
+        values = (stat.st_dev, stat.st_ino, algo) + self.signature(stat) + (digest, self.now)
+        with self.lock:
+            self.connection.execute(query, values)
+            self.written += 1
+            if self.written % self.commit_every == 0: self.connection.commit()
+
+    def close(self):
+        """Evict old entries, compact the file if needed and close it."""
+        with self.lock:
+            cutoff = self.now - self.max_age * 86400
+            evicted = self.connection.execute("DELETE FROM digests WHERE used < ?", (cutoff,)).rowcount
+            self.connection.commit()
+            if evicted: self.connection.execute("VACUUM")
+            self.connection.close()
+
+    @staticmethod
+    def signature(stat):
+        """The part of a stat result that must not change for an entry to stay valid."""
+        return (stat.st_size, stat.st_mtime_ns, stat.st_ctime_ns)
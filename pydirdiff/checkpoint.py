@@ -0,0 +1,121 @@
+# Built-in modules #
+import os, json, time, sqlite3
+
+# Internal modules #
+from pydirdiff.difference import Difference
+
+################################################################################
+class Checkpoint(object):
+    """
+    The progress of a comparison stored in a SQLite database, so that an
+    interrupted run can continue where it stopped instead of starting over.
+
+    Every difference found and every one-sided entry kept for move
+    detection is appended as it comes. Every `every` seconds, once the
+    content checks in flight are done, the frontier of directory pairs
+    still to compare is replaced and everything is committed in a single
+    transaction. When a run is interrupted, whatever came after the last
+    commit is rolled back, and the next run starts again from that
+    frontier. Paths are stored as bytes since they don't have to be
+    valid UTF-8.
+
+    Use it like this:
+
+        state = Checkpoint('~/compare.state', {'first_dir': first, 'secnd_dir': secnd})
+        for diff in state.differences(): print(diff)
+        state.record(diff)
+        state.save([(root1, root2)])
+        state.close(finished=True)
+    """
+
+    schema = ["""CREATE TABLE IF NOT EXISTS meta (
+                    signature TEXT    NOT NULL,
+                    saves     INTEGER NOT NULL)""",
+              """CREATE TABLE IF NOT EXISTS differences (
+                    name   BLOB, path   BLOB, kind   TEXT, status TEXT,
+                    size1  INTEGER, size2  INTEGER,
+                    mtime1 INTEGER, mtime2 INTEGER, other BLOB)""",
+              """CREATE TABLE IF NOT EXISTS frontier (
+                    first BLOB NOT NULL, secnd BLOB NOT NULL)""",
+              """CREATE TABLE IF NOT EXISTS moves (
+                    path BLOB NOT NULL, side INTEGER NOT NULL, directory INTEGER NOT NULL)"""]
+
+    def __repr__(self): return '<%s object on "%s">' % (self.__class__.__name__, self.path)
+
+    def __init__(self, path, signature, every=60):
+        # Base parameters #
+        self.path      = os.path.abspath(os.path.expanduser(path))
+        self.signature = json.dumps(signature, sort_keys=True)
+        self.every     = every
+        self.last_save = time.time()
+        # Create or check #
+        self.connection = sqlite3.connect(self.path)
+        for statement in self.schema: self.connection.execute(statement)
+        row = self.connection.execute("SELECT signature FROM meta").fetchone()
+        if row is None:
+            self.connection.execute("INSERT INTO meta VALUES (?, 0)", (self.signature,))
+        elif row[0] != self.signature:
+            self.connection.close()
+            raise Exception("The state file '%s' was made by a different comparison." % path)
+        self.connection.commit()
+
+    @property
+    def started(self):
+        """Was a checkpoint saved by a previous run?"""
+        return self.connection.execute("SELECT saves FROM meta").fetchone()[0] > 0
+
+    def differences(self):
+        """The differences found before the last checkpoint, in order."""
+        decode = lambda blob: None if blob is None else os.fsdecode(blob)
+        query  = "SELECT * FROM differences ORDER BY rowid"
+        for row in self.connection.execute(query):
+            name, path, kind, status, size1, size2, mtime1, mtime2, other = row
+            diff = Difference(decode(name), decode(path), kind, status, other=decode(other))
+            diff.size1, diff.size2, diff.mtime1, diff.mtime2 = size1, size2, mtime1, mtime2
+            yield diff
+
+    def frontier(self):
+        """The directory pairs that were still to be compared."""
+        query = "SELECT first, secnd FROM frontier ORDER BY rowid"
+        rows  = self.connection.execute(query)
+        return [[os.fsdecode(first), os.fsdecode(secnd)] for first, secnd in rows]
+
+    def moves(self):
+        """The one-sided files and directories kept to find moves,
+        as `(path, side, directory)`."""
+        query = "SELECT path, side, directory FROM moves ORDER BY rowid"
+        rows  = self.connection.execute(query)
+        return [(os.fsdecode(path), side, bool(directory)) for path, side, directory in rows]
+
+    def record(self, diff):
+        """Append a difference, it will be committed at the next checkpoint."""
+        encode = lambda text: None if text is None else os.fsencode(text)
+        values = (encode(diff.name), encode(diff.path), diff.kind, diff.status, diff.size1,
+                  diff.size2, diff.mtime1, diff.mtime2, encode(diff.other))
+        self.connection.execute("INSERT INTO differences VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", values)
+
+    def record_move(self, path, side, directory=False):
+        """Append a one-sided entry for move detection."""
+        values = (os.fsencode(path), side, directory)
+        self.connection.execute("INSERT INTO moves VALUES (?, ?, ?)", values)
+
+    @property
+    def due(self):
+        """Is it time for the next checkpoint?"""
+        return time.time() - self.last_save >= self.every
+
+    def save(self, pairs):
+        """Replace the frontier with these directory pairs, bottom of the
+        stack first, and commit everything recorded so far."""
+        self.connection.execute("UPDATE meta SET saves = saves + 1")
+        self.connection.execute("DELETE FROM frontier")
+        self.connection.executemany("INSERT INTO frontier VALUES (?, ?)",
+                                    ((os.fsencode(pair[0]), os.fsencode(pair[1])) for pair in pairs))
+        self.connection.commit()
+        self.last_save = time.time()
+
+    def close(self, finished=False):
+        """Close the database, dropping what came after the last checkpoint.
+        If the comparison finished, the file isn't needed anymore."""
+        self.connection.close()
+        if finished: os.remove(self.path)
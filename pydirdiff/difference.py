@@ -0,0 +1,36 @@
+################################################################################
+class Difference(object):
+    """
+    One difference found between the two directories, as yielded by
+    `Analysis.differences()`. The sizes and modification times (in
+    nanoseconds) of both sides are filled in when they were looked at,
+    otherwise they are `None`. For files that were moved or renamed,
+    `other` is the path on the second side. Use it like this:
+
+        for diff in Analysis(first_dir, secnd_dir).differences():
+            if diff.status == 'Diverge in size': print(diff.path, diff.size1, diff.size2)
+    """
+
+    __slots__ = ('name', 'path', 'kind', 'status', 'size1', 'size2', 'mtime1', 'mtime2', 'other')
+
+    def __repr__(self):
+        return '<%s "%s" on "%s">' % (self.__class__.__name__, self.status, self.path)
+
+    def __init__(self, name, path, kind, status, stat1=None, stat2=None, other=None):
+        self.name   = name
+        self.path   = path
+        self.kind   = kind
+        self.status = status
+        self.size1  = stat1.st_size     if stat1 is not None else None
+        self.size2  = stat2.st_size     if stat2 is not None else None
+        self.mtime1 = stat1.st_mtime_ns if stat1 is not None else None
+        self.mtime2 = stat2.st_mtime_ns if stat2 is not None else None
+        self.other  = other
+
+    @property
+    def is_error(self):
+        """Was it an error accessing the files rather than a real difference?"""
+        return 'Error' in self.status
+
+    def to_dict(self):
+        return dict((key, getattr(self, key)) for key in self.__slots__)
@@ -0,0 +1,67 @@
+# Built-in modules #
+import os, sys, io, csv, json
+
+################################################################################
+class RecordWriter(object):
+    """
+    Writes one record per difference to a buffered binary stream, without
+    any of the terminal formatting. By default the stream is the standard
+    output with a large buffer, so it can be piped into other tools.
+    """
+
+    buffer_size = 1024 * 1024
+
+    def __init__(self, stream=None):
+        if stream is None:
+            stream = open(sys.stdout.fileno(), 'wb', buffering=self.buffer_size, closefd=False)
+        self.stream = stream
+
+    def write(self, diff):
+        raise NotImplementedError
+
+    def close(self):
+        self.stream.flush()
+
+#------------------------------------------------------------------------------#
+class JsonLinesWriter(RecordWriter):
+    """One JSON object per line with all the attributes of the difference,
+    for instance: {"kind": "f", "status": "Only in first", "path": "/a.txt", ...}"""
+
+    def write(self, diff):
+        self.stream.write(json.dumps(diff.to_dict()).encode('ascii') + b'\n')
+
+#------------------------------------------------------------------------------#
+class CsvWriter(RecordWriter):
+    """Comma separated values with a header line. File names that are not
+    valid UTF-8 are written back as their original bytes."""
+
+    def __init__(self, stream=None):
+        RecordWriter.__init__(self, stream)
+        self.text = io.TextIOWrapper(self.stream, encoding='utf-8',
+                                     errors='surrogateescape', newline='')
+        self.csv = csv.writer(self.text)
+        self.csv.writerow(('kind', 'status', 'path', 'other'))
+
+    def write(self, diff):
+        self.csv.writerow((diff.kind, diff.status, diff.path, diff.other or ''))
+
+    def close(self):
+        self.text.flush()
+        self.text.detach()
+        RecordWriter.close(self)
+
+#------------------------------------------------------------------------------#
+class NullWriter(RecordWriter):
+    """Only the paths, each terminated by a null character, like the
+    output of `find -print0`. Meant to be piped into `xargs -0`."""
+
+    def write(self, diff):
+        self.stream.write(os.fsencode(diff.path) + b'\0')
+
+################################################################################
+# Dictionary to hold them
+record_writers = {
+ 'jsonl': JsonLinesWriter,
+ 'csv':   CsvWriter,
+ 'null0': NullWriter,
+}
@@ -0,0 +1,173 @@
+# Built-in modules #
+import os, json
+
+# Internal modules #
+from pydirdiff.plumbing.common import name_key
+
+################################################################################
+class ManifestStat(object):
+    """The part of an `os.stat_result` that a manifest remembers."""
+
+    __slots__ = ('st_size', 'st_mtime_ns', 'st_ctime_ns')
+
+    def __init__(self, size, mtime_ns, ctime_ns):
+        self.st_size     = size
+        self.st_mtime_ns = mtime_ns
+        self.st_ctime_ns = ctime_ns
+
+    @property
+    def st_mtime(self): return self.st_mtime_ns / 1e9
+    @property
+    def st_ctime(self): return self.st_ctime_ns / 1e9
+
+################################################################################
+class ManifestEntry(object):
+    """
+    Stands in for an `os.DirEntry` when one side of the comparison is
+    a manifest instead of a real directory.
+    """
+
+    __slots__ = ('name', 'path', 'link', 'algo', 'digest', 'info', 'directory')
+
+    def __repr__(self): return '<%s object "%s">' % (self.__class__.__name__, self.path)
+
+    def __init__(self, name, path, link=None, algo=None, digest=None, info=None, directory=False):
+        self.name      = name
+        self.path      = path
+        self.link      = link
+        self.algo      = algo
+        self.digest    = digest
+        self.info      = info
+        self.directory = directory
+
+    def is_dir(self):     return self.directory
+    def is_symlink(self): return self.link is not None
+
+    def stat(self, follow_symlinks=False):
+        if self.info is None: raise OSError("No stat information in manifest for '%s'" % self.path)
+        return self.info
+
+    def digest_for(self, algo):
+        """The digest of this file according to the comparison function
+        named `algo`, if the manifest recorded it."""
+        if algo == 'sizes_only': return self.stat().st_size
+        if algo == self.algo and self.digest is not None:
+            if isinstance(self.digest, str): return bytes.fromhex(self.digest)
+            return self.digest
+        raise IOError("No '%s' digest in manifest for '%s'" % (algo, self.path))
+
+################################################################################
+class Manifest(object):
+    """
+    A snapshot of a directory tree stored in a file: the relative paths,
+    types, sizes and dates of everything in it, and optionally a digest of
+    every file (in hexadecimal). It can be compared against a live directory later on
+    without having to access the original tree again.
+
+    The file is gzipped JSON with one header line followed by one line per
+    directory, written as the tree is walked:
+
+        {"pydirdiff_manifest": 1, "root": "/Volumes/Copy/", "algo": "md5"}
+        ["sub/dir", [[name, size, mtime_ns, ctime_ns, link, digest], ...],
+                    [[name, link], ...]]
+
+    A directory that could not be read has `null` instead of both lists.
+
+    The whole manifest is loaded in memory when it is opened, since the
+    comparison doesn't only visit directories in the order they were
+    written (listings fetched ahead, renamed directories, moved files,
+    subtrees that are skipped). To keep that small, every directory is
+    kept as its line of text and only decoded when it is listed.
+    """
+
+    version = 1
+
+    def __repr__(self): return '<%s object on "%s">' % (self.__class__.__name__, self.path)
+
+    def __init__(self, path):
+        import gzip
+        self.path = path
+        self.listings = {}
+        decoder = json.JSONDecoder()
+        with gzip.open(path, 'rt', encoding='utf-8') as handle:
+            header = json.loads(handle.readline())
+            if header.get('pydirdiff_manifest') != self.version:
+                raise Exception("The file '%s' is not a pydirdiff manifest." % path)
+            self.root = header['root']
+            self.algo = header['algo']
+            # Only the path at the start of every line is decoded now #
+            for line in handle:
+                relative, end = decoder.raw_decode(line, 1)
+                self.listings[relative] = line
+
+    @classmethod
+    def is_manifest(cls, path):
+        """Does this path point to a manifest file rather than a directory?"""
+        return os.path.isfile(os.path.expanduser(path))
+
+    def flat_contents(self, root):
+        """Same as `Analysis.flat_contents` but from the manifest."""
+        relative = root[len(self.root.rstrip('/')):].strip('/')
+        line = self.listings.get(relative)
+        if line is None: return None
+        relative, files, dirs = json.loads(line)
+        if files is None: return None
+        result_files, result_dirs = {}, {}
+        for name, size, mtime_ns, ctime_ns, link, digest in files:
+            info = None if size is None else ManifestStat(size, mtime_ns, ctime_ns)
+            result_files[name] = ManifestEntry(name, root + '/' + name, link, self.algo, digest, info)
+        for name, link in dirs:
+            result_dirs[name] = ManifestEntry(name, root + '/' + name, link, directory=True)
+        return result_files, result_dirs
+
+    @classmethod
+    def write(cls, directory, path, cmp_fn=None, algo=None):
+        """
+        Walk `directory` and write its manifest to `path`. If a comparison
+        function is given, the digest of every file is recorded too.
+        Returns the number of directories written.
+        """
+        import gzip
+        root = os.path.abspath(os.path.expanduser(directory)).rstrip('/') + '/'
+        count = 0
+        with gzip.open(path, 'wt', encoding='utf-8') as handle:
+            header = {'pydirdiff_manifest': cls.version, 'root': root,
+                      'algo': algo if cmp_fn else None}
+            handle.write(json.dumps(header) + '\n')
+            stack = ['']
+            while stack:
+                relative = stack.pop()
+                listing  = cls.scan(root + relative, cmp_fn)
+                handle.write(json.dumps([relative] + list(listing)) + '\n')
+                count += 1
+                if listing[1] is None: continue
+                subdirs = [name for name, link in listing[1] if link is None]
+                subdirs.sort(key=name_key, reverse=True)
+                stack.extend(os.path.join(relative, name) for name in subdirs)
+        return count
+
+    @staticmethod
+    def scan(directory, cmp_fn=None):
+        """The files and directories of one directory, as written in a manifest."""
+        files, dirs = [], []
+        try:
+            with os.scandir(directory) as entries: entries = list(entries)
+        except OSError: return None, None
+        for entry in entries:
+            try:                is_dir = entry.is_dir()
+            except OSError:     is_dir = False
+            link = os.readlink(entry.path) if entry.is_symlink() else None
+            if is_dir:
+                dirs.append([entry.name, link])
+                continue
+            try: stat = entry.stat(follow_symlinks=False)
+            except OSError:
+                files.append([entry.name, None, None, None, link, None])
+                continue
+            digest = None
+            if cmp_fn and link is None:
+                try: digest = cmp_fn(entry.path)
+                except IOError: pass
+                if isinstance(digest, bytes): digest = digest.hex()
+            files.append([entry.name, stat.st_size, stat.st_mtime_ns, stat.st_ctime_ns, link, digest])
+        return files, dirs
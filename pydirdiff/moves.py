@@ -0,0 +1,148 @@
+# Internal modules #
+from pydirdiff.plumbing.common import natural_sort
+from pydirdiff.spill           import SpilledListing, entries
+
+################################################################################
+def partial_fingerprint(path, size, blocksize=65536, samples=4, reader=None):
+    """
+    A cheap fingerprint of a file made from its first block, its last
+    block and a few blocks evenly spaced in between. Two files with
+    different fingerprints are certainly different, two files with the same
+    fingerprint still need a full comparison. The blocks are read through
+    `reader` if there is one, like the other comparisons.
+    """
+    import hashlib
+    result = hashlib.md5()
+    offsets = [0, max(0, size - blocksize)]
+    offsets += [(size * (i + 1)) // (samples + 1) for i in range(samples)]
+    offsets  = sorted(set(offsets))
+    if reader is not None:
+        with open(path, "rb", buffering=0) as handle:
+            blocks = reader.blocks(handle, offsets, blocksize)
+            # Reads in flight must be over before the file is closed #
+            try:
+                for block in blocks: result.update(block)
+            finally: blocks.close()
+        return result.digest()
+    with open(path, "rb") as handle:
+        for offset in offsets:
+            handle.seek(offset)
+            result.update(handle.read(blocksize))
+    return result.digest()
+
+################################################################################
+def walk_files(lister, root):
+    """All the file entries beneath a directory, using the same `lister`
+    function as the comparison (so it works with manifests and spilled
+    listings too)."""
+    stack = [root]
+    while stack:
+        contents = lister(stack.pop())
+        if contents is None: continue
+        for entry in entries(contents, 'f'): yield entry
+        stack.extend(entry.path for entry in entries(contents, 'd') if not entry.is_symlink())
+        if isinstance(contents, SpilledListing): contents.close()
+
+################################################################################
+class MoveDetector(object):
+    """
+    Finds files that only exist in the first directory and files that only
+    exist in the second directory, but that have the same contents. These
+    are files that were moved or renamed.
+
+    Comparing every one-sided file to every other would be quadratic, so
+    the files are first put in buckets by size. Inside a bucket, files are
+    split again according to a cheap partial fingerprint, and only then
+    according to a full digest. Empty files are ignored.
+    """
+
+    def __init__(self, full_fn, partial_fn=partial_fingerprint):
+        self.full_fn    = full_fn
+        self.partial_fn = partial_fn
+        self.buckets    = {}
+
+    def add(self, entry, side):
+        """Add a one-sided file entry. `side` is 0 for the first directory
+        and 1 for the second one."""
+        try: size = entry.stat(follow_symlinks=False).st_size
+        except OSError: return
+        if size == 0 or entry.is_symlink(): return
+        self.buckets.setdefault(size, ([], []))[side].append(entry)
+
+    def pairs(self):
+        """Yield the (first_entry, secnd_entry) pairs with identical contents,
+        sorted by the path of the first entry."""
+        result = []
+        for size, (firsts, secnds) in self.buckets.items():
+            if not firsts or not secnds: continue
+            groups = [(firsts, secnds)]
+            stages = [] if self.partial_fn is None else [lambda e: self.partial_fn(e.path, size)]
+            for key_fn in stages + [self.full_fn]:
+                groups = [group for subset in groups for group in self.split(subset, key_fn)]
+            for firsts, secnds in groups:
+                firsts = sorted(firsts, key=lambda e: natural_sort(e.path))
+                secnds = sorted(secnds, key=lambda e: natural_sort(e.path))
+                result.extend(zip(firsts, secnds))
+        result.sort(key=lambda pair: natural_sort(pair[0].path))
+        return result
+
+    @staticmethod
+    def split(subset, key_fn):
+        """Split a group of candidates according to a key, keeping only
+        the subgroups that still have files on both sides."""
+        keyed = {}
+        for side, entries in enumerate(subset):
+            for entry in entries:
+                try: key = key_fn(entry)
+                except (IOError, OSError): continue
+                keyed.setdefault(key, ([], []))[side].append(entry)
+        return [group for group in keyed.values() if group[0] and group[1]]
+
+################################################################################
+def directory_tokens(contents):
+    """The set of child names (and file sizes) used to tell if two
+    directories are in fact the same one under a different name."""
+    files, dirs = contents
+    tokens = set('d/' + name for name in dirs)
+    for name, entry in files.items():
+        try: tokens.add('f/%s/%i' % (name, entry.stat(follow_symlinks=False).st_size))
+        except OSError: tokens.add('f/' + name)
+    return tokens
+
+def match_directories(firsts, secnds, threshold, max_frequency=100):
+    """
+    Given two dictionaries of directory names to token sets, find the
+    pairs whose Jaccard similarity is at least `threshold`. Returns a list
+    of `(name1, name2, score)`, each name appearing at most once, the most
+    similar pairs being matched first.
+
+    To avoid comparing every directory to every other, an inverted index
+    of tokens is built on the second side, and only directories sharing
+    at least one token are scored. Tokens shared by more than
+    `max_frequency` directories (such as `Thumbs.db`) carry no information
+    and are skipped, which slightly lowers the scores.
+    """
+    # Inverted index #
+    index = {}
+    for name, tokens in secnds.items():
+        for token in tokens: index.setdefault(token, []).append(name)
+    # Score every candidate #
+    candidates = []
+    for name1, tokens1 in firsts.items():
+        shared = {}
+        for token in tokens1:
+            names = index.get(token, ())
+            if len(names) > max_frequency: continue
+            for name2 in names: shared[name2] = shared.get(name2, 0) + 1
+        for name2, count in shared.items():
+            score = count / float(len(tokens1) + len(secnds[name2]) - count)
+            if score >= threshold: candidates.append((score, name1, name2))
+    # Greedy matching, best scores first #
+    candidates.sort(key=lambda c: (-c[0], natural_sort(c[1]), natural_sort(c[2])))
+    used1, used2, result = set(), set(), []
+    for score, name1, name2 in candidates:
+        if name1 in used1 or name2 in used2: continue
+        used1.add(name1)
+        used2.add(name2)
+        result.append((name1, name2, score))
+    return result
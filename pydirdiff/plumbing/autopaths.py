@@ -1,12 +1,11 @@
 # Built-in modules #
-import os, stat, tempfile, subprocess, shutil, codecs, gzip
-import glob, warnings, zipfile
+import os, stat
 
 # Internal modules #
 from pydirdiff.plumbing.common import md5sum, natural_sort
 
-# Third party modules #
-import sh
+# Other modules are imported inside the methods that need them, #
+# so that importing this module stays cheap.                    #
 
 ################################################################################
 class DirectoryPath(str):
@@ -148,6 +147,7 @@ class DirectoryPath(str):
     def remove(self):
         if not self.exists: return False
         if self.is_symlink: return self.remove_when_symlink()
+        import shutil
         shutil.rmtree(self.path, ignore_errors=True)
         return True
 
@@ -172,12 +172,14 @@ class DirectoryPath(str):
 
     def zip(self, keep_orig=False):
         """Make a zip archive of the directory"""
+        import shutil
         shutil.make_archive(self.prefix_path , "zip", self.directory, self.name)
         if not keep_orig: self.remove()
 
     def link_from(self, where, safe=False):
         """Make a link here pointing to another directory somewhere else.
         The destination is hence self.path and the source is *where*"""
+        import warnings
         if not safe:
             self.remove()
             return os.symlink(where, self.path.rstrip('/'))
@@ -189,15 +191,18 @@ class DirectoryPath(str):
 
     def copy(self, path):
         assert not os.path.exists(path)
+        import shutil
         shutil.copytree(self.path, path)
 
     def glob(self, pattern):
         """Perform a glob search in this directory."""
+        import glob
         files = glob.glob(self.path + pattern)
         return map(FilePath, files)
 
     def find(self, pattern):
         """Find a file in this directory."""
+        import glob
         f = glob.glob(self.path + pattern)[0]
         return FilePath(f)
 
@@ -255,6 +260,7 @@ class FilePath(str):
         if "~" in path: path = os.path.expanduser(path)
         # Expand star #
         if "*" in path:
+            import glob
             matches = glob.glob(path)
             if len(matches) < 1: raise Exception("Found exactly no files matching '%s'" % path)
             if len(matches) > 1: raise Exception("Found several files matching '%s'" % path)
@@ -317,6 +323,7 @@ class FilePath(str):
     @property
     def count(self):
         """We are going to default to the number of lines."""
+        import sh
         return int(sh.wc('-l', self.path).split()[0])
 
     @property
@@ -378,6 +385,7 @@ class FilePath(str):
 
     #-------------------------------- Methods --------------------------------#
     def read(self, encoding=None):
+        import codecs
         with codecs.open(self.path, 'r', encoding) as handle: content = handle.read()
         return content
 
@@ -397,12 +405,14 @@ class FilePath(str):
         self.handle.close()
 
     def write(self, content, encoding=None):
+        import codecs
         if encoding is None:
             with open(self.path, 'w') as handle: handle.write(content)
         else:
             with codecs.open(self.path, 'w', encoding) as handle: handle.write(content)
 
     def writelines(self, content, encoding=None):
+        import codecs
         if encoding is None:
             with open(self.path, 'w') as handle: handle.writelines(content)
         else:
@@ -417,9 +427,11 @@ class FilePath(str):
         # Directory special case #
         if path.endswith('/'): path += self.filename
         # Normal case #
+        import shutil
         shutil.copy2(self.path, path)
 
     def execute(self):
+        import subprocess
         return subprocess.call([self.path])
 
     def replace_extension(self, new_extension='txt'):
@@ -450,6 +462,7 @@ class FilePath(str):
         if path.endswith('/'): path = path + self.filename
         # Normal case #
         assert not os.path.exists(path)
+        import shutil
         shutil.move(self.path, path)
         # Update the internal link #
         self.path = path
@@ -459,6 +472,7 @@ class FilePath(str):
         assert '/' not in new_name
         path = self.directory + new_name
         assert not os.path.exists(path)
+        import shutil
         shutil.move(self.path, path)
         # Update the internal link #
         self.path = path
@@ -502,6 +516,7 @@ class FilePath(str):
 
     def gzip_to(self, path=None):
         """Make a gzipped version of the file at a given path."""
+        import gzip
         if path is None: path = self.path + ".gz"
         with open(self.path, 'rb') as orig_file:
             with gzip.open(path, 'wb') as new_file:
@@ -510,6 +525,7 @@ class FilePath(str):
 
     def ungzip_to(self, path=None, mode='w'):
         """Make an unzipped version of the file at a given path."""
+        import gzip
         if path is None: path = self.path[:3]
         with gzip.open(self, 'rb') as orig_file:
             with open(path, mode) as new_file:
@@ -519,6 +535,7 @@ class FilePath(str):
     def unzip_to(self, destination=None, inplace=False, single=True):
         """Unzip a standard zip file. Can specify the destination of the
         uncompressed file, or just set inplace=True to delete the original."""
+        import zipfile, tempfile, shutil
         # Check #
         assert zipfile.is_zipfile(self.path)
         # Load #
@@ -560,10 +577,10 @@ class Filesize(object):
         # Record the size #
         self.size = size
         # Pick the system used #
-        if system is 'binary':
+        if system == 'binary':
             self.chunk = 1024
             self.units = ['bytes', 'KiB', 'MiB', 'GiB', 'TiB', 'PiB']
-        elif system is 'decimal':
+        elif system == 'decimal':
             self.chunk = 1000
             self.units = ['bytes', 'KB', 'MB', 'GB', 'TB', 'PB']
         else:
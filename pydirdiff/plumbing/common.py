@@ -1,7 +1,7 @@
 # -*- coding: utf-8 -*-
 
 # Built-in modules #
-import re, hashlib, unicodedata
+import os, re, sys, unicodedata
 
 # One liners #
 flatter = lambda x: [item for sublist in x for item in sublist]
@@ -21,6 +21,13 @@ def sanitize_text(text):
     return text
 
 ###############################################################################
+# Compiled once, natural_sort is called for every name in every directory #
+natural_regex = re.compile(r'(\d+)')
+
+def natural_number(match):
+    digits = str(int(match.group(0)))
+    return '\0' + chr(len(digits)) + digits
+
 def natural_sort(item):
     """
     Sort strings that contain numbers correctly. Works in Python 2 and 3.
@@ -29,17 +36,242 @@ def natural_sort(item):
     >>> l.sort(key=natural_sort)
     >>> l.__repr__()
     "['v1.2.1', 'v1.2.3', 'v1.2.5', 'v1.2.15', 'v1.3.3', 'v1.3.12']"
+
+    The key is a single string in which every number is replaced by a
+    null character, its number of digits and its digits. Comparing
+    strings is much faster than comparing lists of strings and integers.
+    """
+    return natural_regex.sub(natural_number, item.lower())
+
+def name_key(name):
+    """The order in which the names of a directory are handed out.
+    Names like `F8` and `f8` or `file01` and `file1` have the same
+    natural key, so the name itself breaks the tie."""
+    return (natural_sort(name), name)
+
+def merge_listings(first, secnd, key=name_key):
+    """
+    Go through the names of two listings (dictionaries) in a single pass
+    and in natural order, yielding `(name, in_first, in_secnd)` for every
+    name found on either side. The names are sorted only once, instead of
+    building sets of the missing and existing names and sorting each.
     """
-    dre = re.compile(r'(\d+)')
-    return [int(s) if s.isdigit() else s.lower() for s in re.split(dre, item)]
+    for name in sorted(first.keys() | secnd.keys(), key=key):
+        yield name, name in first, name in secnd
 
 ################################################################################
-def md5sum(file_path, blocksize=65536):
+def md5sum(file_path, blocksize=65536, reader=None):
     """Compute the md5 of a file. Pretty fast."""
+    import hashlib
     result = hashlib.md5()
-    with open(file_path, "rb") as f:
-        chunk = f.read(blocksize)
-        while chunk:
-            result.update(chunk)
-            chunk = f.read(blocksize)
-    return result.hexdigest()
\ No newline at end of file
+    with open(file_path, "rb", buffering=0) as f:
+        for chunk in read_chunks(f, blocksize, reader): result.update(chunk)
+    return result.hexdigest()
+
+################################################################################
+# Files smaller than this are read rather than memory-mapped #
+mmap_threshold = 4 * 1048576
+
+def map_file(handle):
+    """Memory-map an open file for reading, with a hint to the kernel that
+    it will be read sequentially. Returns `None` if the file is too small
+    to be worth it or if it can't be mapped (some network filesystems,
+    files bigger than the address space on 32-bit systems)."""
+    import mmap
+    if os.fstat(handle.fileno()).st_size < mmap_threshold: return None
+    try: mapped = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError, OverflowError): return None
+    if hasattr(mapped, 'madvise') and hasattr(mmap, 'MADV_SEQUENTIAL'):
+        mapped.madvise(mmap.MADV_SEQUENTIAL)
+    return mapped
+
+def file_chunks(handle, blocksize=1048576):
+    """
+    Yield the contents of an open file as successive `memoryview` slices
+    of one reused buffer filled with `readinto`, without allocating a new
+    object for every chunk. A chunk is only valid until the next one is
+    requested. Every chunk is `blocksize` long except the last one, even
+    when unbuffered reads come back short (network filesystems, pipes),
+    so that the chunks of two files can be compared one by one.
+    """
+    with memoryview(bytearray(blocksize)) as view:
+        while True:
+            count = 0
+            while count < blocksize:
+                with view[count:] as rest: read = handle.readinto(rest)
+                if not read: break
+                count += read
+            if not count: return
+            chunk = view[:count]
+            try:     yield chunk
+            finally: chunk.release()
+            if count < blocksize: return
+
+def mapped_chunks(handle, blocksize=1048576):
+    """
+    Same as `file_chunks` but with slices of a memory map when the file
+    can be mapped. Only safe on files that nobody truncates while they
+    are read: touching a page past the new end kills the process with
+    SIGBUS instead of giving a short read.
+    """
+    mapped = map_file(handle)
+    if mapped is None:
+        yield from file_chunks(handle, blocksize)
+        return
+    try:
+        with memoryview(mapped) as view:
+            for start in range(0, len(view), blocksize):
+                chunk = view[start:start+blocksize]
+                try:     yield chunk
+                finally: chunk.release()
+    finally: mapped.close()
+
+def read_chunks(handle, blocksize=1048576, reader=None):
+    """The chunks of an open file, from `file_chunks` or, if a reader
+    like `ReadAhead` or `MappedReader` is given, from that reader."""
+    if reader is None: return file_chunks(handle, blocksize)
+    return reader.chunks(handle, blocksize)
+
+################################################################################
+# The FIEMAP ioctl of Linux and the size of its header and of one extent #
+fiemap_ioctl  = 0xC020660B
+fiemap_header = 32
+fiemap_extent = 56
+
+def physical_offset(path):
+    """
+    Where the first byte of a file is on its device, asked to the
+    filesystem with the FIEMAP ioctl, or `None` if that can't be known:
+    not on Linux, not supported by the filesystem (network, tmpfs),
+    or an empty file with no extent.
+    """
+    if not sys.platform.startswith('linux'): return None
+    import fcntl, struct
+    request = struct.pack('=QQIIII', 0, 0xFFFFFFFFFFFFFFFF, 0, 0, 1, 0) + bytes(fiemap_extent)
+    try:
+        with open(path, 'rb', buffering=0) as handle:
+            result = fcntl.ioctl(handle.fileno(), fiemap_ioctl, request)
+    except (OSError, ValueError): return None
+    if struct.unpack_from('=I', result, 20)[0] == 0: return None
+    return struct.unpack_from('=Q', result, fiemap_header + 8)[0]
+
+################################################################################
+# Hash algorithms and the third party module they need, if any #
+hash_modules = {
+ 'md5':     None,
+ 'sha1':    None,
+ 'sha256':  None,
+ 'blake2b': None,
+ 'xxh3':    'xxhash',
+ 'blake3':  'blake3',
+}
+
+def hash_available(algorithm):
+    """Is this hash algorithm usable here? Doesn't import anything."""
+    import importlib.util
+    module = hash_modules[algorithm]
+    return module is None or importlib.util.find_spec(module) is not None
+
+def new_hash(algorithm):
+    """A new hash object for one of the algorithms in `hash_modules`."""
+    if algorithm == 'xxh3':
+        import xxhash
+        return xxhash.xxh3_128()
+    if algorithm == 'blake3':
+        from blake3 import blake3
+        return blake3(max_threads=blake3.AUTO)
+    import hashlib
+    return hashlib.new(algorithm)
+
+def file_digest(file_path, algorithm='md5', blocksize=65536, reader=None):
+    """Compute the digest of a file with any of the algorithms in
+    `hash_modules`. Returns raw bytes, which are cheaper to compare
+    than a hexadecimal string."""
+    result = new_hash(algorithm)
+    with open(file_path, "rb", buffering=0) as f:
+        for chunk in read_chunks(f, blocksize, reader): result.update(chunk)
+    return result.digest()
+
+################################################################################
+def bytes_identical(first_path, secnd_path, blocksize=1048576, reader=None):
+    """Compare two files by reading them in lockstep, chunk by chunk.
+    Stops at the first chunk that differs instead of running through
+    both files entirely like `md5sum` would. The chunks of the first
+    file are copied into a scratch buffer because comparing a `bytearray`
+    to a `memoryview` is a plain `memcmp`, whereas comparing two
+    `memoryview` objects goes through them item by item."""
+    import itertools
+    scratch = bytearray()
+    with open(first_path, "rb", buffering=0) as f1, open(secnd_path, "rb", buffering=0) as f2:
+        chunks1, chunks2 = read_chunks(f1, blocksize, reader), read_chunks(f2, blocksize, reader)
+        # Reads in flight must be over before the files are closed #
+        try:
+            for chunk1, chunk2 in itertools.zip_longest(chunks1, chunks2):
+                if chunk1 is None or chunk2 is None: return False
+                scratch[:] = chunk1
+                if scratch != chunk2: return False
+        finally:
+            chunks1.close()
+            chunks2.close()
+    return True
+
+################################################################################
+def sample_offsets(size, samples=16, blocksize=1048576, seed=0):
+    """
+    The offsets of the blocks read by `sample_identical`: the start, the
+    end, and `samples` pseudo-random offsets in between. They only depend
+    on the size and the seed, so both files of a pair are read at the
+    same places, and the same places are read again on the next run.
+    """
+    import random
+    if size <= blocksize * (samples + 2): return list(range(0, size, blocksize)) or [0]
+    generator = random.Random("%i-%i" % (seed, size))
+    offsets = set([0, size - blocksize])
+    offsets.update(generator.randrange(blocksize, size - blocksize) for i in range(samples))
+    return sorted(offsets)
+
+def sample_identical(first_path, secnd_path, samples=16, blocksize=1048576, seed=0, reader=None):
+    """Compare two files of the same size by reading only a few blocks at
+    the offsets given by `sample_offsets`. Small files are read entirely.
+    With a `ReadAhead` engine, the blocks of both files are requested
+    all at once instead of one after the other."""
+    size = os.path.getsize(first_path)
+    offsets = sample_offsets(size, samples, blocksize, seed)
+    if reader is not None:
+        with open(first_path, "rb", buffering=0) as f1, open(secnd_path, "rb", buffering=0) as f2:
+            blocks1 = reader.blocks(f1, offsets, blocksize)
+            blocks2 = reader.blocks(f2, offsets, blocksize)
+            # Reads in flight must be over before the files are closed #
+            try:
+                for block1, block2 in zip(blocks1, blocks2):
+                    if block1 != block2: return False
+            finally:
+                blocks1.close()
+                blocks2.close()
+        return True
+    with open(first_path, "rb") as f1, open(secnd_path, "rb") as f2:
+        for offset in offsets:
+            f1.seek(offset)
+            f2.seek(offset)
+            if f1.read(blocksize) != f2.read(blocksize): return False
+    return True
+
+def sample_coverage(size, samples=16, blocksize=1048576, seed=0):
+    """How many bytes of a file of this size `sample_identical` reads."""
+    covered, end = 0, 0
+    for offset in sample_offsets(size, samples, blocksize, seed):
+        start = max(offset, end)
+        end   = min(offset + blocksize, size)
+        covered += max(0, end - start)
+    return covered
+
+################################################################################
+def peak_memory():
+    """The highest resident set size of this process so far, in bytes,
+    or `None` on platforms without the `resource` module."""
+    try: import resource
+    except ImportError: return None
+    import sys
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux counts in kilobytes, macOS in bytes #
+    return peak if sys.platform == 'darwin' else peak * 1024
@@ -4,8 +4,11 @@ import os, sys
 # Internal modules #
 from pydirdiff.plumbing.autopaths import DirectoryPath
 
-# Third party modules #
-import sh
+################################################################################
+def git(*args, **kwargs):
+    """Run a git command. The `sh` module is only imported when needed."""
+    import sh
+    return sh.git(*args, **kwargs)
 
 ###############################################################################
 class GitRepo(DirectoryPath):
@@ -30,61 +33,76 @@ class GitRepo(DirectoryPath):
     @property
     def tag(self):
         """For instance: u'1.0.3-69-gf0c796d-dirty'"""
-        tag = sh.git(self.default + ["describe", "--tags", "--dirty", "--always"])
+        tag = git(self.default + ["describe", "--tags", "--dirty", "--always"])
         return tag.strip('\n')
 
     @property
     def hash(self):
         """For instance: u'f0c796dae64a5a118d88e60523c011d535e8c476'"""
-        sha1 = sh.git(self.default + ["rev-parse", "HEAD"])
+        sha1 = git(self.default + ["rev-parse", "HEAD"])
         return sha1.strip('\n')
 
     @property
     def short_hash(self):
         """For instance: u'f0c796d'"""
-        sha1 = sh.git(self.default + ["rev-parse", "--short", "HEAD"])
+        sha1 = git(self.default + ["rev-parse", "--short", "HEAD"])
         return sha1.strip('\n')
 
+    @property
+    def head_short_hash(self):
+        """Same as `short_hash` but by reading the files in the git directory
+        directly, without starting any subprocess. For instance: u'f0c796d'"""
+        with open(self.git_dir + '/HEAD') as handle: head = handle.read().strip()
+        if not head.startswith('ref: '): return head[:7]
+        ref = head[5:]
+        # The reference is either loose or packed #
+        if os.path.exists(self.git_dir + '/' + ref):
+            with open(self.git_dir + '/' + ref) as handle: return handle.read().strip()[:7]
+        with open(self.git_dir + '/packed-refs') as handle:
+            for line in handle:
+                if line.rstrip('\n').endswith(' ' + ref): return line[:7]
+        raise Exception("Could not find the reference '%s' in '%s'" % (ref, self.git_dir))
+
     @property
     def branch(self):
         """For instance: u'master'"""
-        result = sh.git(self.default + ['symbolic-ref', '--short', 'HEAD'])
+        result = git(self.default + ['symbolic-ref', '--short', 'HEAD'])
         return result.strip('\n')
 
     @property
     def branches(self):
         """All branches in a list"""
-        result = sh.git(self.default + ['branch', '-a', '--no-color'])
+        result = git(self.default + ['branch', '-a', '--no-color'])
         return [l.strip(' *\n') for l in result.split('\n') if l.strip(' *\n')]
 
     @property
     def remote_branch(self):
         """For instance: u'origin/master'"""
-        result = sh.git(self.default + ['rev-parse', '--symbolic-full-name', '--abbrev-ref', '@{u}'])
+        result = git(self.default + ['rev-parse', '--symbolic-full-name', '--abbrev-ref', '@{u}'])
         return result.strip('\n')
 
     @property
     def remote_url(self):
         """For instance: u'origin/master'"""
-        result = sh.git(self.default + ['remote', 'get-url', 'origin'])
+        result = git(self.default + ['remote', 'get-url', 'origin'])
         return result.strip('\n')
 
     #--------------------------------- Methods -------------------------------#
     def clone_from(self, remote_url):
         """Clone it when it doesn't exist yet."""
         assert not self
-        sh.git('clone', remote_url, self.path)
+        git('clone', remote_url, self.path)
 
     def re_clone(self, repo_dir):
         """Clone again, somewhere else"""
-        sh.git('clone', self.remote_url, repo_dir)
+        git('clone', self.remote_url, repo_dir)
         return GitRepo(repo_dir)
 
     def add(self, what):
-        return sh.git(self.default + ['add', what])
+        return git(self.default + ['add', what])
 
     def commit(self, message):
-        return sh.git(self.default + ['commit', '-m', '"' + message + '"'])
+        return git(self.default + ['commit', '-m', '"' + message + '"'])
 
     def push(self, source=None, destination=None, tags=False, shell=False):
         # Command #
@@ -95,8 +113,8 @@ class GitRepo(DirectoryPath):
         if source:                 command.append(source)
         if source and destination: command.append(destination)
         # Show on shell #
-        if shell: return sh.git(command, _out=sys.stdout, _err=sys.stderr)
-        else:     return sh.git(command)
+        if shell: return git(command, _out=sys.stdout, _err=sys.stderr)
+        else:     return git(command)
 
     def tag_head(self, tag):
-        return sh.git(self.default + ['tag', tag, 'HEAD'])
\ No newline at end of file
+        return git(self.default + ['tag', tag, 'HEAD'])
\ No newline at end of file
@@ -0,0 +1,109 @@
+# Built-in modules #
+import os
+from collections import deque
+
+################################################################################
+class ReadAhead(object):
+    """
+    Reads files with many requests in flight at once, for filesystems
+    where every request has a high latency, like network or FUSE mounts
+    of object storage. A single pool of threads issues `os.pread` calls
+    (which release the GIL) on behalf of every file being read, and each
+    of them has up to `depth` blocks requested ahead of the one being
+    consumed. With several files read concurrently, the number of
+    requests in flight is up to `threads`.
+
+    Blocks come back in order as `bytes` objects, so the consumer doesn't
+    change. Use it like this:
+
+        reader = ReadAhead(threads=64, depth=8)
+        with open('/mnt/bucket/big.iso', 'rb', buffering=0) as handle:
+            for chunk in reader.chunks(handle, 1048576): digest.update(chunk)
+        reader.close()
+    """
+
+    def __repr__(self): return '<%s object with depth %i>' % (self.__class__.__name__, self.depth)
+
+    def __init__(self, threads=16, depth=8, initializer=None, initargs=()):
+        from concurrent.futures import ThreadPoolExecutor
+        self.depth = int(depth)
+        self.pool  = ThreadPoolExecutor(max_workers=int(threads), thread_name_prefix='pydirdiff-read',
+                                        initializer=initializer, initargs=initargs)
+
+    def blocks(self, handle, offsets, blocksize):
+        """
+        Yield the blocks of `blocksize` bytes at each of the `offsets` of an
+        open file, in order, keeping `depth` of them requested ahead. A
+        block is shorter only at the end of the file. If the caller stops
+        early, the requests in flight are cancelled or waited for, since
+        the file descriptor is about to be closed.
+        """
+        fd, offsets, window = handle.fileno(), iter(offsets), deque()
+        def request():
+            offset = next(offsets, None)
+            if offset is not None: window.append(self.pool.submit(read_block, fd, blocksize, offset))
+        try:
+            for i in range(self.depth): request()
+            while window:
+                block = window.popleft().result()
+                request()
+                yield block
+        finally:
+            for future in window: future.cancel()
+            for future in window:
+                if not future.cancelled(): future.exception()
+
+    def chunks(self, handle, blocksize=1048576):
+        """Yield the whole contents of an open file as successive blocks.
+        If the file grew since it was opened, the rest is read too."""
+        size = os.fstat(handle.fileno()).st_size
+        end  = 0
+        for block in self.blocks(handle, range(0, size, blocksize), blocksize):
+            if not block: return
+            end += len(block)
+            yield block
+            if len(block) < blocksize: return
+        while True:
+            block = read_block(handle.fileno(), blocksize, end)
+            if not block: return
+            end += len(block)
+            yield block
+
+    def close(self):
+        self.pool.shutdown(wait=True, cancel_futures=True)
+
+################################################################################
+class MappedReader(object):
+    """
+    Reads files through a memory map instead of copying them into a
+    buffer, which saves a copy on local disks. Files smaller than
+    `mmap_threshold` or that can't be mapped are read normally. Not
+    meant for files that can be truncated while they are read (live
+    volumes), since the process then dies with SIGBUS.
+    """
+
+    def __repr__(self): return '<%s object>' % self.__class__.__name__
+
+    def chunks(self, handle, blocksize=1048576):
+        from pydirdiff.plumbing.common import mapped_chunks
+        return mapped_chunks(handle, blocksize)
+
+    def blocks(self, handle, offsets, blocksize):
+        for offset in offsets: yield read_block(handle.fileno(), blocksize, offset)
+
+    def close(self): pass
+
+################################################################################
+def read_block(fd, blocksize, offset):
+    """Read `blocksize` bytes at `offset`, retrying after short reads,
+    which some network filesystems do in the middle of a file."""
+    block = os.pread(fd, blocksize, offset)
+    if len(block) in (0, blocksize): return block
+    parts = [block]
+    done  = len(block)
+    while done < blocksize:
+        part = os.pread(fd, blocksize - done, offset + done)
+        if not part: break
+        parts.append(part)
+        done += len(part)
+    return b''.join(parts)
@@ -0,0 +1,110 @@
+# Built-in modules #
+import time, threading
+
+################################################################################
+class Stats(object):
+    """Counters and timing histograms that can be updated from several
+    threads, to find out where the time of a long process went.
+
+    Use it like this:
+
+        stats = Stats()
+        stats.add('bytes', 4096)
+        with stats.timer('listing'): os.listdir('/')
+        stats.print_report()
+    """
+
+    # Upper bounds of the histogram buckets, in seconds #
+    bounds = [1e-5, 1e-4, 1e-3, 1e-2, 1e-1, 1.0, 10.0]
+    labels = ['<10us', '<100us', '<1ms', '<10ms', '<100ms', '<1s', '<10s', '>=10s']
+
+    def __init__(self):
+        self.lock     = threading.Lock()
+        self.counters = {}
+        self.timings  = {}
+
+    def add(self, name, amount=1):
+        """Increment a counter."""
+        with self.lock: self.counters[name] = self.counters.get(name, 0) + amount
+
+    def record(self, name, seconds):
+        """Add one duration to a timing: its count, total, maximum
+        and the histogram bucket it falls in."""
+        bucket = 0
+        while bucket < len(self.bounds) and seconds >= self.bounds[bucket]: bucket += 1
+        with self.lock:
+            timing = self.timings.get(name)
+            if timing is None:
+                timing = self.timings[name] = {'count': 0, 'total': 0.0, 'max': 0.0,
+                                               'histogram': [0] * len(self.labels)}
+            timing['count'] += 1
+            timing['total'] += seconds
+            timing['max']    = max(timing['max'], seconds)
+            timing['histogram'][bucket] += 1
+
+    def timer(self, name): return StatsTimer(self, name)
+
+    def merge(self, other):
+        """Add the counters and timings of another dictionary made by
+        `to_dict`, for instance coming from another process."""
+        with self.lock:
+            for name, amount in other['counters'].items():
+                self.counters[name] = self.counters.get(name, 0) + amount
+            for name, timing in other['timings'].items():
+                mine = self.timings.get(name)
+                if mine is None:
+                    self.timings[name] = dict(timing, histogram=list(timing['histogram']))
+                    continue
+                mine['count'] += timing['count']
+                mine['total'] += timing['total']
+                mine['max']    = max(mine['max'], timing['max'])
+                mine['histogram'] = [a + b for a, b in zip(mine['histogram'], timing['histogram'])]
+
+    def to_dict(self, reset=False):
+        """Everything as plain types, ready to be written as JSON."""
+        with self.lock:
+            result = {'counters':  dict(self.counters),
+                      'timings':   dict((k, dict(v)) for k, v in self.timings.items()),
+                      'buckets':   list(self.labels)}
+            if reset: self.counters, self.timings = {}, {}
+        return result
+
+    def dump(self, path, **extra):
+        """Write everything to a JSON file, with extra top level keys."""
+        import json
+        with open(path, 'w') as handle:
+            json.dump(dict(self.to_dict(), **extra), handle, indent=4, sort_keys=True)
+
+    def print_report(self):
+        """Print one line per timing and per counter, sorted by name."""
+        with self.lock:
+            timings  = sorted(self.timings.items())
+            counters = sorted(self.counters.items())
+        if timings:
+            print("%-20s %10s %10s %10s %10s  %s" %
+                  ('Timing', 'Calls', 'Total (s)', 'Mean (ms)', 'Max (ms)', 'Histogram'))
+        for name, timing in timings:
+            mean = 1000.0 * timing['total'] / timing['count']
+            histogram = ' '.join('%s:%i' % (label, n) for label, n in
+                                 zip(self.labels, timing['histogram']) if n)
+            print("%-20s %10i %10.3f %10.3f %10.3f  %s" % (name, timing['count'], timing['total'],
+                                                           mean, 1000.0 * timing['max'], histogram))
+        if counters: print("%-20s %10s" % ('Counter', 'Value'))
+        for name, value in counters: print("%-20s %10i" % (name, value))
+
+################################################################################
+class StatsTimer(object):
+    """Context manager that records the time spent inside it."""
+
+    __slots__ = ('stats', 'name', 'start')
+
+    def __init__(self, stats, name):
+        self.stats = stats
+        self.name  = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        self.stats.record(self.name, time.perf_counter() - self.start)
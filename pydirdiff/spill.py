@@ -0,0 +1,149 @@
+# Built-in modules #
+import os, heapq
+
+# Internal modules #
+from pydirdiff.plumbing.common import name_key
+
+# The sort order of entries, the same as the names of in-memory listings #
+def entry_key(entry): return name_key(entry.name)
+
+################################################################################
+class SpilledEntry(object):
+    """
+    Stands in for an `os.DirEntry` when the listing of a directory was
+    spilled to disk. Only the type of the entry is remembered, its stat
+    result is fetched again the first time it is needed.
+    """
+
+    __slots__ = ('name', 'path', 'link', 'directory', 'info')
+
+    def __repr__(self): return '<%s object "%s">' % (self.__class__.__name__, self.path)
+
+    def __init__(self, name, path, link=False, directory=False):
+        self.name      = name
+        self.path      = path
+        self.link      = link
+        self.directory = directory
+        self.info      = None
+
+    def is_dir(self):     return self.directory
+    def is_symlink(self): return self.link
+
+    def stat(self, follow_symlinks=False):
+        if self.info is None: self.info = os.stat(self.path, follow_symlinks=follow_symlinks)
+        return self.info
+
+################################################################################
+class SpilledListing(object):
+    """
+    The listing of a directory with too many entries to be kept in memory.
+    As the directory is scanned, every batch of entries is sorted and
+    written to a file (a run) in `directory`, one record per entry:
+    a type byte followed by the name and a null character. Reading the
+    listing back is a merge of all the runs, in natural order, so only one
+    block per run is in memory at any time.
+
+    Use it like this:
+
+        listing = SpilledListing('/mail/spool', '/tmp/pydirdiff-xyz')
+        listing.spill(files, dirs)
+        for entry in listing.entries('f'): print(entry.name)
+        listing.close()
+    """
+
+    blocksize = 65536
+    fan_in    = 32
+
+    def __repr__(self): return '<%s object on "%s">' % (self.__class__.__name__, self.root)
+
+    def __init__(self, root, directory):
+        self.root      = root
+        self.directory = directory
+        self.runs      = {'f': [], 'd': []}
+        self.count     = 0
+
+    def spill(self, files, dirs):
+        """Write one sorted run for the files and one for the directories,
+        then empty both dictionaries. Once there are `fan_in` runs of one
+        kind they are merged into one, so that reading the listing back
+        never needs too many open files."""
+        for kind, listing in (('f', files), ('d', dirs)):
+            if not listing: continue
+            self.runs[kind].append(self.write(kind, sorted(listing.values(), key=entry_key)))
+            self.count += len(listing)
+            listing.clear()
+            if len(self.runs[kind]) >= self.fan_in:
+                merged = self.write(kind, self.entries(kind))
+                self.remove(self.runs[kind])
+                self.runs[kind] = [merged]
+
+    def write(self, kind, entries):
+        """Write sorted entries to a new run and return its path."""
+        import tempfile
+        handle, path = tempfile.mkstemp(suffix='.run', dir=self.directory)
+        with open(handle, 'wb', buffering=1048576) as run:
+            for entry in entries:
+                code = b'l' if entry.is_symlink() else kind.encode()
+                run.write(code + os.fsencode(entry.name) + b'\0')
+        return path
+
+    def entries(self, kind):
+        """All the files (`kind` is 'f') or directories ('d') as
+        `SpilledEntry` objects, sorted. Can be called several times."""
+        runs = [self.read(path, kind == 'd') for path in self.runs[kind]]
+        return heapq.merge(*runs, key=entry_key)
+
+    def read(self, path, directory):
+        """The entries of one run, in the order they were written."""
+        with open(path, 'rb') as handle:
+            rest = b''
+            for block in iter(lambda: handle.read(self.blocksize), b''):
+                records = (rest + block).split(b'\0')
+                rest = records.pop()
+                for record in records:
+                    name = os.fsdecode(record[1:])
+                    yield SpilledEntry(name, self.root + '/' + name, record[:1] == b'l', directory)
+
+    def close(self):
+        """Remove the runs from the disk."""
+        self.remove(self.runs['f'] + self.runs['d'])
+        self.runs = {'f': [], 'd': []}
+
+    @staticmethod
+    def remove(paths):
+        for path in paths:
+            try: os.remove(path)
+            except OSError: pass
+
+################################################################################
+def entries(contents, kind):
+    """The sorted file or directory entries of a listing, whether it is
+    the usual pair of dictionaries or a `SpilledListing`."""
+    if isinstance(contents, SpilledListing): return contents.entries(kind)
+    listing = contents[0] if kind == 'f' else contents[1]
+    return iter(sorted(listing.values(), key=entry_key))
+
+def merge_entries(first, secnd):
+    """
+    Merge-join two sorted streams of entries in a single pass. Yields
+    `(name, entry1, entry2)` where one of the two entries is `None` if
+    the name is only on one side.
+    """
+    entry1, entry2 = next(first, None), next(secnd, None)
+    while entry1 is not None and entry2 is not None:
+        key1, key2 = entry_key(entry1), entry_key(entry2)
+        if key1 == key2:
+            yield entry1.name, entry1, entry2
+            entry1, entry2 = next(first, None), next(secnd, None)
+        elif key1 < key2:
+            yield entry1.name, entry1, None
+            entry1 = next(first, None)
+        else:
+            yield entry2.name, None, entry2
+            entry2 = next(secnd, None)
+    while entry1 is not None:
+        yield entry1.name, entry1, None
+        entry1 = next(first, None)
+    while entry2 is not None:
+        yield entry2.name, None, entry2
+        entry2 = next(secnd, None)
@@ -0,0 +1,155 @@
+# Built-in modules #
+import os, sys, time, threading
+from contextlib import nullcontext
+
+# Internal modules #
+from pydirdiff.plumbing.common import read_chunks
+
+################################################################################
+class TokenBucket(object):
+    """
+    Limits a flow to `rate` units per second on average, while allowing
+    bursts of up to `burst` units (one second worth by default). Every
+    consumer takes what it used from the bucket and sleeps as long as the
+    bucket is in debt, so several threads share the same rate.
+    """
+
+    def __init__(self, rate, burst=None):
+        self.rate     = float(rate)
+        self.capacity = float(burst if burst is not None else rate)
+        self.tokens   = self.capacity
+        self.last     = time.monotonic()
+        self.lock     = threading.Lock()
+
+    def take(self, amount):
+        """Remove `amount` tokens, sleeping until they would have
+        been available at the given rate."""
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.last) * self.rate)
+            self.last   = now
+            self.tokens -= amount
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+        if wait > 0: time.sleep(wait)
+
+################################################################################
+class TreeLimit(object):
+    """
+    The limits of one of the two trees: how many listings and file reads
+    can happen in it at the same time, and how many megabytes per second
+    can be read from it. `None` means no limit.
+    """
+
+    def __repr__(self):
+        return '<%s object, %s at once, %s MB/s>' % (self.__class__.__name__,
+                                                      self.concurrency, self.bandwidth)
+
+    def __init__(self, concurrency=None, bandwidth=None):
+        self.concurrency = concurrency
+        self.bandwidth   = bandwidth
+        self.semaphore   = threading.Semaphore(concurrency) if concurrency else None
+        self.bucket      = TokenBucket(bandwidth * 1e6) if bandwidth else None
+
+    def slot(self):
+        """A context manager holding one of the concurrent operations."""
+        if self.semaphore is None: return nullcontext()
+        return self.semaphore
+
+    def consume(self, count):
+        """Account for `count` bytes that were just read."""
+        if self.bucket is not None: self.bucket.take(count)
+
+################################################################################
+class ThrottledReader(object):
+    """
+    Reads files like `ReadAhead` does (or like `file_chunks` if there is
+    no other reader to wrap) while respecting the limits of the tree each
+    file is in. A file takes one of the concurrent operations of its tree
+    from its first block to its last, and every block read is taken from
+    the bandwidth of its tree.
+
+    Use it like this:
+
+        reader = ThrottledReader({'/data': TreeLimit(2, 50.0), '/backup': TreeLimit()})
+        digest = file_digest('/data/big.iso', reader=reader)
+    """
+
+    def __init__(self, limits, reader=None):
+        # The longest root first, so that nested roots are matched right #
+        self.limits = sorted(((root.rstrip('/') + '/', limit) for root, limit in limits.items()),
+                             key=lambda item: len(item[0]), reverse=True)
+        self.reader = reader
+
+    def limit_for(self, path):
+        """The limits of the tree a path is in."""
+        for root, limit in self.limits:
+            if path.startswith(root): return limit
+        return TreeLimit()
+
+    def chunks(self, handle, blocksize=1048576):
+        limit = self.limit_for(handle.name)
+        with limit.slot():
+            chunks = read_chunks(handle, blocksize, self.reader)
+            try:
+                for chunk in chunks:
+                    limit.consume(len(chunk))
+                    yield chunk
+            finally: chunks.close()
+
+    def blocks(self, handle, offsets, blocksize):
+        limit = self.limit_for(handle.name)
+        with limit.slot():
+            if self.reader is not None: blocks = self.reader.blocks(handle, offsets, blocksize)
+            else: blocks = (os.pread(handle.fileno(), blocksize, offset) for offset in offsets)
+            try:
+                for block in blocks:
+                    limit.consume(len(block))
+                    yield block
+            finally: blocks.close()
+
+    def close(self):
+        if self.reader is not None: self.reader.close()
+
+################################################################################
+def per_tree(value, cast):
+    """
+    A limit given either once for both trees or as `first,secnd`, on the
+    command line or as a pair from python. Returns a pair where `None`
+    (or zero) means no limit.
+    """
+    if value is None: return (None, None)
+    if isinstance(value, str): value = value.split(',')
+    if not isinstance(value, (list, tuple)): value = [value]
+    if len(value) == 1: value = list(value) * 2
+    if len(value) != 2: raise Exception("A limit is either one value or two separated by a comma.")
+    return tuple(None if v in (None, '', 'None') or float(v) == 0 else cast(v) for v in value)
+
+# The classes of the `ionice` command that make sense for a scan #
+ionice_classes = {'idle': '3', 'best-effort': '2'}
+
+def check_ionice(setting):
+    """Raise an exception if this I/O priority can't be used here."""
+    name, sep, level = str(setting).partition(':')
+    if name not in ionice_classes or (level and (name == 'idle' or level not in list('01234567'))):
+        raise Exception("The I/O priority '%s' is not valid, use `idle` or `best-effort:0`"
+                        " to `best-effort:7`." % setting)
+    if not sys.platform.startswith('linux'):
+        raise Exception("Setting the I/O priority is only possible on Linux.")
+    import shutil
+    if shutil.which('ionice') is None:
+        raise Exception("Setting the I/O priority needs the `ionice` command.")
+
+def set_ionice(setting):
+    """
+    Lower the I/O priority of the calling thread with the `ionice`
+    command, for instance to `idle` so that the disks only serve it when
+    nothing else needs them. On Linux, the priority is set on that thread
+    only and inherited by the threads it starts afterwards, which is why
+    it is meant to be the `initializer` of a pool of worker threads.
+    """
+    import subprocess
+    check_ionice(setting)
+    name, sep, level = setting.partition(':')
+    command = ['ionice', '-c', ionice_classes[name]]
+    if level: command += ['-n', level]
+    subprocess.check_call(command + ['-p', str(threading.get_native_id())])
@@ -12,5 +12,6 @@ setup(
         author_email     = 'lucas.sinclair@me.com',
         packages         = ['pydirdiff'],
         scripts          = ['pydirdiff/pydirdiff'],
-        install_requires = ['sh'],
+        # Only the helpers that call `git` or `wc` need it #
+        extras_require   = {'git': ['sh']},
     )
@@ -0,0 +1,21 @@
+# Built-in modules #
+import os, sys, subprocess
+
+################################################################################
+def test_closed_pipe(tmp_path):
+    """A consumer that stops reading the records early, like `head`, ends
+    the comparison without a traceback."""
+    first, secnd = tmp_path / 'first', tmp_path / 'secnd'
+    for directory in (first, secnd): directory.mkdir()
+    for i in range(5000): (first / ('file%i.txt' % i)).write_text('')
+    repos   = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env     = dict(os.environ, PYTHONPATH=repos)
+    for fmt in ('jsonl', 'csv', 'text'):
+        command = [sys.executable, '-m', 'pydirdiff', str(first), str(secnd), '--format=' + fmt]
+        process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=env)
+        process.stdout.readline()
+        process.stdout.close()
+        error = process.stderr.read().decode()
+        process.wait()
+        assert 'Traceback' not in error
+        assert 'BrokenPipeError' not in error
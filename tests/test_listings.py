@@ -0,0 +1,44 @@
+# Built-in modules #
+import os, sys, subprocess
+
+# Internal modules #
+import pydirdiff
+from pydirdiff.plumbing.common import merge_listings
+
+# Names that have the same natural sort key #
+names = ['f8', 'F8', 'file1', 'file01', 'File1', 'a', 'A', 'b10', 'B10', 'b9']
+
+# Printed by a fresh interpreter, whose string hashes depend on the seed #
+child_code = """
+from pydirdiff.plumbing.common import merge_listings
+names = %r
+print([name for name, in1, in2 in merge_listings(dict.fromkeys(names[::2]), dict.fromkeys(names[1::2]))])
+""" % names
+
+################################################################################
+def test_merge_listings_ties():
+    """Names with equal natural keys come out in the same order whatever
+    the hash seed is."""
+    repos  = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    orders = set()
+    for seed in ('0', '1', '2', '3'):
+        env = dict(os.environ, PYTHONHASHSEED=seed, PYTHONPATH=repos)
+        orders.add(subprocess.check_output([sys.executable, '-c', child_code], env=env))
+    assert len(orders) == 1
+    merged = [name for name, in1, in2 in merge_listings(dict.fromkeys(names), {})]
+    assert merged == ['A', 'a', 'b9', 'B10', 'b10', 'F8', 'f8', 'File1', 'file01', 'file1']
+
+def test_spilled_order(tmp_path):
+    """A listing spilled to disk hands out its names in the same order as
+    one kept in memory."""
+    first, secnd = tmp_path / 'first', tmp_path / 'secnd'
+    for directory in (first, secnd): directory.mkdir()
+    for i, name in enumerate(names):
+        (first / name).write_text('first')
+        if i % 3: (secnd / name).write_text('secnd!')
+    def paths(**kwargs):
+        analysis = pydirdiff.Analysis(str(first), str(secnd), verbose=False, **kwargs)
+        return [diff.path for diff in analysis.differences()]
+    in_memory = paths()
+    assert len(in_memory) == len(names)
+    assert paths(max_entries=3, spill_dir=str(tmp_path)) == in_memory